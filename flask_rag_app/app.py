@@ -6,21 +6,36 @@ from werkzeug.utils import secure_filename
 # Import processing functions
 from step1_step2_document_loading_chunking import process_uploaded_file
 from step3_document_embedding import process_uploaded_embedding
-from step4_vector_store import process_uploaded_vector_store
-from step5_retrieval import query_retrieval
+from step4_vector_store import process_uploaded_vector_store, get_chroma_client, CHROMA_DB_DIR
+from step5_retrieval import query_retrieval, embed_query, get_collections, warm_up_llm
+from ollama_client import OllamaBusyError
+from index_versions import ingest_lock
 
 app = Flask(__name__)
 
-UPLOAD_FOLDER = "uploads"
+UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", "uploads")
 app.config["UPLOAD_FOLDER"] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
 ALLOWED_EXTENSIONS = {"pdf", "docx"}
 
+# Set once this worker has loaded everything it needs to answer a query
+_ready = False
+
 def allowed_file(filename):
     """Check if the file type is allowed."""
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def warm_up():
+    """Open the vector store, run one query embedding and load the LLM, then mark the worker ready."""
+    global _ready
+    get_chroma_client()
+    get_collections()
+    embed_query("O-RAN warm-up")
+    warm_up_llm()  # Ollama unreachable only logs a warning; retrieval can still be served
+    _ready = True
+    print(f"DEBUG: Worker {os.getpid()} warmed up and ready")
+
 # === Route: Serve the Custom UI ===
 @app.route("/")
 def index():
@@ -56,7 +71,9 @@ def upload_file():
         # Process only the uploaded file
         process_uploaded_file(save_path)  # Step 1 & 2: Process & Chunk
         process_uploaded_embedding(save_path)  # Step 3: Generate Embeddings
-        process_uploaded_vector_store(save_path)  # Step 4: Store in Vector DB
+        # Chroma writes from every worker, the ingest daemon and step 4's swap are serialized
+        with ingest_lock(CHROMA_DB_DIR):
+            process_uploaded_vector_store(save_path)  # Step 4: Store in Vector DB
 
         return jsonify({"message": f"File '{filename}' uploaded and processed successfully!"})
 
@@ -64,6 +81,13 @@ def upload_file():
         print(f"ERROR: File upload failed - {str(e)}")
         return jsonify({"error": f"File upload failed: {str(e)}"}), 500
 
+# === Route: Readiness Probe ===
+@app.route("/ready")
+def ready():
+    if not _ready:
+        return jsonify({"status": "warming up"}), 503
+    return jsonify({"status": "ready", "pid": os.getpid()})
+
 # === Route: Process Query and Get Response ===
 @app.route("/query", methods=["POST"])
 def query():
@@ -76,16 +100,29 @@ def query():
 
         print(f"DEBUG: Received query: {user_query}")
 
-        structured_response, generic_response = query_retrieval(user_query)
+        # Optional list of shards (years or spec families) to restrict the search to
+        shards = data.get("shards")
+        if shards is not None and not (isinstance(shards, list) and all(isinstance(shard, str) for shard in shards)):
+            return jsonify({"error": "shards must be a list of strings."}), 400
+
+        structured_response, generic_response, grounding = query_retrieval(user_query, shards=shards)
 
         return jsonify({
             "rag_output": structured_response,  # RAG pipeline output
-            "llama_output": generic_response
+            "llama_output": generic_response,
+            "confidence": grounding["confidence"] if grounding else None,  # How well rag_output is supported by the retrieved chunks
+            "grounding": grounding
         })
 
+    except OllamaBusyError as e:
+        print(f"DEBUG: Rejected query, LLM queue full - {str(e)}")
+        return jsonify({"error": str(e)}), 503, {"Retry-After": "1"}
+
     except Exception as e:
         print(f"ERROR: {str(e)}")
         return jsonify({"error": f"Internal error: {str(e)}"}), 500
 
 if __name__ == "__main__":
+    # Development server; use `gunicorn -c gunicorn.conf.py wsgi:app` in production
+    warm_up()
     app.run(debug=True)
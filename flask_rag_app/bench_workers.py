@@ -0,0 +1,105 @@
+import os
+import sys
+import time
+import shutil
+import tempfile
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+# === Configuration ===
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_PORT = 8765
+BENCH_QUERY = "Describe the architecture of O-RAN Near-RT RIC."
+
+def wait_until_ready(base_url, workers, timeout=600):
+    """Poll /ready until every worker has answered healthy at least once."""
+    ready_pids = set()
+    deadline = time.time() + timeout
+    while time.time() < deadline and len(ready_pids) < workers:
+        try:
+            response = requests.get(f"{base_url}/ready", timeout=2)
+            if response.status_code == 200:
+                ready_pids.add(response.json()["pid"])
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    return len(ready_pids) >= workers
+
+def run_load(base_url, requests_total, concurrency):
+    """Send `requests_total` queries at the given concurrency; return (req/s, errors)."""
+    session = requests.Session()
+
+    def one(_):
+        try:
+            return session.post(f"{base_url}/query", json={"query": BENCH_QUERY}, timeout=900).status_code == 200
+        except requests.RequestException:
+            return False
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(requests_total)))
+    elapsed = time.perf_counter() - start
+    return requests_total / elapsed, outcomes.count(False)
+
+def bench(worker_counts, requests_total, concurrency, env_overrides=None):
+    base_url = f"http://127.0.0.1:{BENCH_PORT}"
+    results = []
+    for workers in worker_counts:
+        env = dict(os.environ, **(env_overrides or {}), WEB_CONCURRENCY=str(workers), BIND=f"127.0.0.1:{BENCH_PORT}")
+        server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+                                  cwd=APP_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not wait_until_ready(base_url, workers):
+                print(f"❌ {workers} worker(s) never became ready, skipping")
+                continue
+            throughput, errors = run_load(base_url, requests_total, concurrency)
+            results.append((workers, throughput, errors))
+            print(f"✅ {workers} worker(s): {throughput:.2f} req/s, {errors} errors")
+        finally:
+            server.terminate()
+            server.wait()
+
+    if results:
+        baseline = results[0][1] / results[0][0]
+        print("\n| Workers | req/s | Speed-up | Efficiency | Errors |")
+        print("|---|---|---|---|---|")
+        for workers, throughput, errors in results:
+            speedup = throughput / results[0][1]
+            print(f"| {workers} | {throughput:.2f} | {speedup:.2f}x | {throughput / (baseline * workers):.0%} | {errors} |")
+
+def bench_with_stub(worker_counts, requests_total, concurrency, stub_latency, stub_token_rate, stub_tokens, fixture_docs):
+    """bench() against load_test.py's stub LLM and fixture store, for hosts without Ollama or an index."""
+    from load_test import STUB_PORT, start_stub_ollama, build_fixture_store, scratch_env
+
+    work_dir = tempfile.mkdtemp(prefix="oran-bench-")
+    chroma_db_dir = os.path.join(work_dir, "chroma_index")
+    stub = start_stub_ollama(STUB_PORT, stub_latency, stub_token_rate, stub_tokens)
+    print(f"🤖 Stub Ollama on :{STUB_PORT} ({stub_latency}s latency, {stub_tokens} tokens at {stub_token_rate}/s)")
+    try:
+        build_fixture_store(chroma_db_dir, fixture_docs)
+        bench(worker_counts, requests_total, concurrency, scratch_env(work_dir, chroma_db_dir))
+    finally:
+        stub.shutdown()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure /query throughput against the number of gunicorn workers.")
+    parser.add_argument("--workers", default="1,2,4", help="Comma-separated worker counts to try")
+    parser.add_argument("--requests", type=int, default=64, help="Queries sent per worker count")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent client connections")
+    parser.add_argument("--stub-llm", action="store_true",
+                        help="Serve a fixture store against load_test.py's stub LLM instead of the configured Ollama and index")
+    parser.add_argument("--stub-latency", type=float, default=0.5, help="With --stub-llm: seconds before the first token")
+    parser.add_argument("--stub-token-rate", type=float, default=20.0, help="With --stub-llm: tokens per second")
+    parser.add_argument("--stub-tokens", type=int, default=100, help="With --stub-llm: tokens per answer")
+    parser.add_argument("--fixture-docs", type=int, default=50, help="With --stub-llm: synthetic documents in the fixture store")
+    args = parser.parse_args()
+    worker_counts = [int(n) for n in args.workers.split(",")]
+    if args.stub_llm:
+        bench_with_stub(worker_counts, args.requests, args.concurrency, args.stub_latency, args.stub_token_rate,
+                        args.stub_tokens, args.fixture_docs)
+    else:
+        bench(worker_counts, args.requests, args.concurrency)
@@ -0,0 +1,133 @@
+import os
+import re
+import gzip
+import json
+from itertools import islice
+
+try:
+    import zstandard  # Optional: pip install zstandard
+except ImportError:
+    zstandard = None
+
+# === Configuration ===
+ARTIFACT_COMPRESSION = "gzip"  # "none", "gzip" or "zstd"
+ARTIFACT_EXTENSIONS = {"none": ".jsonl", "gzip": ".jsonl.gz", "zstd": ".jsonl.zst"}
+
+def artifact_path(base_path, compression=ARTIFACT_COMPRESSION):
+    """`base_path` (e.g. ".../X_chunks") plus the extension for `compression`."""
+    if compression == "zstd" and zstandard is None:
+        print("⚠️ zstandard is not installed, falling back to gzip artifacts")
+        compression = "gzip"
+    return base_path + ARTIFACT_EXTENSIONS[compression]
+
+def open_artifact(path, mode):
+    """Open a JSONL artifact for text reading ("r") or writing ("w"), compressed by extension."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8", compresslevel=6)
+    if path.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"zstandard is required to open {path}")
+        if mode == "w":
+            return zstandard.open(path, "w", encoding="utf-8", cctx=zstandard.ZstdCompressor(level=3))
+        return zstandard.open(path, "r", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+def write_artifact(path, header, records):
+    """Stream `records` to a JSONL artifact whose first line is `header`; return the record count.
+
+    Written to a temporary file and renamed into place, so readers never see a partial artifact.
+    """
+    tmp_path = os.path.join(os.path.dirname(path), f".tmp-{os.path.basename(path)}")  # Same extension, hidden
+    count = 0
+    try:
+        with open_artifact(tmp_path, "w") as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for record in records:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                count += 1
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)  # A failed embedder or full disk must not leave a partial artifact behind
+        raise
+    os.replace(tmp_path, path)
+    return count
+
+def read_artifact(path):
+    """Return (header, records), where records lazily yields one dict per line.
+
+    Also reads the legacy pretty-printed `_chunks.json` / `_embeddings.json` files.
+    """
+    if path.endswith(".json"):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, list):  # Legacy embeddings: a bare list of chunk records
+            return {"title": data[0].get("title") if data else None}, iter(data)
+        return {"title": data.get("title")}, iter(data.get("chunks", []))
+
+    f = open_artifact(path, "r")
+    header = json.loads(f.readline())
+
+    def records():
+        with f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+    return header, records()
+
+def artifact_document_name(filename, kind):
+    """Document name for an artifact file name, e.g. "X_chunks.jsonl.gz" -> "X"."""
+    for extension in (*ARTIFACT_EXTENSIONS.values(), ".json"):
+        if filename.endswith(extension):
+            filename = filename[:-len(extension)]
+            break
+    if filename.endswith(f"_{kind}"):
+        return filename[:-len(kind) - 1]
+    # Legacy split: "X_chunks_part2" keeps its part suffix so outputs don't collide
+    return filename.replace(f"_{kind}_part", "_part")
+
+def find_artifacts(directory, kind):
+    """Paths of every `kind` ("chunks" or "embeddings") artifact in `directory`, one per document.
+
+    JSONL artifacts win over legacy JSON for the same document; legacy part files are all included.
+    """
+    if not os.path.isdir(directory):
+        return []
+    by_document = {}
+    for filename in sorted(os.listdir(directory)):
+        if filename.startswith("."):
+            continue  # Artifacts still being written
+        is_jsonl = any(filename.endswith(f"_{kind}{extension}") for extension in ARTIFACT_EXTENSIONS.values())
+        is_legacy = filename.endswith(f"_{kind}.json") or re.search(rf"_{kind}_part\d+\.json$", filename)
+        if not (is_jsonl or is_legacy):
+            continue
+        document = artifact_document_name(filename, kind)
+        if is_jsonl or document not in by_document:
+            by_document[document] = os.path.join(directory, filename)
+    return list(by_document.values())
+
+def find_years(base_dir, prefix=""):
+    """Years that have a `<prefix><year>` directory in `base_dir`, e.g. INPUT_DIR/2025 or Output_2025, sorted.
+
+    Every step discovers years this way, so a year the ingest daemon picks up survives a full rebuild.
+    """
+    if not os.path.isdir(base_dir):
+        return []
+    return sorted(entry.name[len(prefix):] for entry in os.scandir(base_dir)
+                  if entry.is_dir() and entry.name.startswith(prefix) and entry.name[len(prefix):].isdigit())
+
+def find_document_artifact(directory, document, kind):
+    """Path of `document`'s `kind` artifact in `directory`, or None."""
+    for path in find_artifacts(directory, kind):
+        if artifact_document_name(os.path.basename(path), kind) == document:
+            return path
+    return None
+
+def iter_batches(iterable, size):
+    """Yield lists of up to `size` items without materializing `iterable`."""
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
@@ -0,0 +1,92 @@
+import re
+import math
+import numpy as np
+
+# === Configuration ===
+COMPRESSION_RATIO = 1.0  # Share of retrieved sentences kept for the prompt; 1.0 turns compression off.
+                         # Lower it (e.g. 0.3) only after rag_evaluation.py shows no quality loss on the corpus
+MIN_KEPT_SENTENCES = 5  # Never compress below this many sentences
+SENTENCE_BATCH_SIZE = 128
+SENTENCE_BOUNDARY_PATTERN = re.compile(r"(?<=[.!?])\s+(?=[A-Z0-9(\"'\[])")
+ABBREVIATIONS = {"e.g.", "i.e.", "etc.", "cf.", "vs.", "fig.", "figs.", "sec.", "no.", "eq.", "ref.", "approx.", "al."}
+
+
+def split_context_sentences(text):
+    """Sentences of retrieved spec text, for compression.
+
+    Unlike grounding.split_sentences (made for LLM answers), section numbers ("3.2.1 E2 Setup")
+    and short lines such as table cells or IE names are kept, and abbreviations like "e.g." or
+    "Fig." don't end a sentence. Every line break is a boundary.
+    """
+    sentences = []
+    for line in (text or "").splitlines():
+        current = ""
+        for piece in SENTENCE_BOUNDARY_PATTERN.split(line.strip()):
+            current = f"{current} {piece}" if current else piece
+            if current and current.split()[-1].lower() not in ABBREVIATIONS:
+                sentences.append(current)
+                current = ""
+        if current:
+            sentences.append(current)
+    return sentences
+
+
+def count_tokens(text):
+    """Whitespace token count, the same measure as the chunks' token_length."""
+    return len(text.split())
+
+
+def compress_chunks(model, query, retrieved_chunks, ratio=COMPRESSION_RATIO):
+    """Keep only the context sentences most similar to `query`; returns (compressed chunks, stats).
+
+    Chunks are dicts with a "content" key. Every sentence of every chunk is embedded in one batched
+    call (together with the query) and scored with a single matrix-vector product. The top `ratio`
+    share is kept, in document order: chunks keep their retrieval order and sentences their order
+    within the chunk. Chunks left with no sentences are dropped.
+
+    A compressed chunk's "embedding" becomes the normalized mean of its kept sentences' vectors, so
+    grounding is scored against the text the LLM was actually sent (no extra encoding).
+    """
+    tokens_before = sum(count_tokens(chunk["content"]) for chunk in retrieved_chunks)
+    stats = {"sentences_before": 0, "sentences_after": 0, "tokens_before": tokens_before, "tokens_after": tokens_before}
+    if ratio >= 1.0 or not retrieved_chunks:
+        return retrieved_chunks, stats
+
+    sentences, owners = [], []
+    for chunk_index, chunk in enumerate(retrieved_chunks):
+        for sentence in split_context_sentences(chunk["content"]):
+            sentences.append(sentence)
+            owners.append(chunk_index)
+    stats["sentences_before"] = stats["sentences_after"] = len(sentences)
+    keep_count = max(MIN_KEPT_SENTENCES, math.ceil(ratio * len(sentences)))
+    if keep_count >= len(sentences):
+        return retrieved_chunks, stats
+
+    vectors = np.asarray(model.encode([query] + sentences, batch_size=SENTENCE_BATCH_SIZE), dtype=np.float32)
+    vectors /= np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    scores = vectors[1:] @ vectors[0]
+    kept = np.sort(np.argpartition(-scores, keep_count - 1)[:keep_count])  # Top sentences, back in document order
+
+    kept_by_chunk = {}
+    for i in kept:
+        kept_by_chunk.setdefault(owners[i], []).append(i)
+    compressed = []
+    for chunk_index, chunk in enumerate(retrieved_chunks):
+        if chunk_index not in kept_by_chunk:
+            continue
+        indices = kept_by_chunk[chunk_index]
+        embedding = vectors[1:][indices].mean(axis=0)
+        embedding /= max(float(np.linalg.norm(embedding)), 1e-12)
+        compressed.append({**chunk, "content": " ".join(sentences[i] for i in indices), "embedding": embedding.tolist()})
+
+    stats["sentences_after"] = keep_count
+    stats["tokens_after"] = sum(count_tokens(chunk["content"]) for chunk in compressed)
+    return compressed, stats
+
+
+def format_compression(stats):
+    """One-line report of what compression saved."""
+    saved = stats["tokens_before"] - stats["tokens_after"]
+    share = saved / stats["tokens_before"] if stats["tokens_before"] else 0.0
+    return (f"kept {stats['sentences_after']}/{stats['sentences_before']} sentences, "
+            f"{stats['tokens_before']} → {stats['tokens_after']} tokens ({saved} saved, {share:.0%})")
@@ -0,0 +1,110 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+import numpy as np
+
+# === Configuration ===
+EMBEDDING_CACHE_PATH = os.environ.get("EMBEDDING_CACHE_PATH", "/home/sswarna/Documents/oran_docs/output_all/embedding_cache.sqlite")
+EMBEDDING_CACHE_MAX_ENTRIES = 500000  # Least recently used entries beyond this are evicted
+ENCODE_BATCH_SIZE = 64
+
+
+class EmbeddingCache:
+    """Persistent embedding cache keyed by sha256(model name, chunk text), with LRU eviction."""
+
+    def __init__(self, model_name, path=EMBEDDING_CACHE_PATH, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._pid = None
+
+    @property
+    def _db(self):
+        """SQLite connection for the current process, (re)opened after a fork."""
+        if self._conn is None or self._pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            # Shared by the batch pipeline and every app worker: WAL lets readers run during a write
+            self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings (last_used)")
+            self._conn.commit()
+            self._pid = os.getpid()
+        return self._conn
+
+    def _key(self, text):
+        return hashlib.sha256(f"{self.model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def embed(self, model, texts):
+        """Return one embedding (list of floats) per text, encoding only the cache misses."""
+        keys = [self._key(text) for text in texts]
+        vectors = [None] * len(texts)
+        now = time.time()
+
+        with self._lock:
+            found = {}
+            for start in range(0, len(keys), 500):  # Stay under SQLite's bound-parameter limit
+                batch = list(set(keys[start:start + 500]))
+                rows = self._db.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({','.join('?' * len(batch))})", batch
+                ).fetchall()
+                found.update(rows)
+            if found:
+                self._db.executemany("UPDATE embeddings SET last_used = ? WHERE key = ?", [(now, key) for key in found])
+                self._db.commit()
+
+        missing = []
+        for i, key in enumerate(keys):
+            if key in found:
+                vectors[i] = np.frombuffer(found[key], dtype=np.float32).tolist()
+            else:
+                missing.append(i)
+
+        if missing:
+            # Identical texts within the batch are encoded once
+            unique = {}
+            for i in missing:
+                unique.setdefault(keys[i], texts[i])
+            encoded = model.encode(list(unique.values()), batch_size=ENCODE_BATCH_SIZE)
+            new_vectors = dict(zip(unique.keys(), (np.asarray(vector, dtype=np.float32) for vector in encoded)))
+            for i in missing:
+                vectors[i] = new_vectors[keys[i]].tolist()
+
+            with self._lock:
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO embeddings (key, vector, last_used) VALUES (?, ?, ?)",
+                    [(key, vector.tobytes(), now) for key, vector in new_vectors.items()]
+                )
+                self._db.commit()
+                self._evict()
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return vectors
+
+    def _evict(self):
+        """Drop the least recently used entries beyond max_entries (caller holds the lock)."""
+        (count,) = self._db.execute("SELECT COUNT(*) FROM embeddings").fetchone()
+        excess = count - self.max_entries
+        if excess > 0:
+            self._db.execute(
+                "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+            )
+            self._db.commit()
+
+    def report(self, reset=True):
+        """One-line hit-rate summary for the current run."""
+        total = self.hits + self.misses
+        rate = self.hits / total if total else 0.0
+        summary = f"🗄️ Embedding cache: {self.hits}/{total} hits ({rate:.1%}), {self.misses} misses"
+        if reset:
+            self.hits = self.misses = 0
+        return summary
@@ -0,0 +1,44 @@
+import re
+import numpy as np
+
+# === Configuration ===
+SUPPORTED_SIMILARITY = 0.6  # A sentence counts as supported if some retrieved chunk is at least this similar
+MIN_SENTENCE_CHARS = 15  # Shorter fragments ("Yes.", list markers) are not scored
+SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[.!?])\s+|\n+")
+
+
+def split_sentences(text):
+    """Answer sentences worth scoring, with markdown bullets and emphasis stripped."""
+    sentences = []
+    for sentence in SENTENCE_SPLIT_PATTERN.split(text or ""):
+        sentence = re.sub(r"^\s*(?:[-*•]|\d+[.)])\s*", "", sentence).replace("**", "").strip()
+        if len(sentence) >= MIN_SENTENCE_CHARS:
+            sentences.append(sentence)
+    return sentences
+
+
+def _normalize(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+
+
+def grounding_score(model, answer, chunk_embeddings):
+    """How well `answer` is supported by the retrieved chunks, from their stored embeddings.
+
+    Only the answer's sentences are embedded (one small batch); each is matched against every
+    chunk embedding. Returns None when there is nothing to score, otherwise a dict with:
+      confidence   - mean over sentences of the best chunk cosine similarity (grounding)
+      faithfulness - share of sentences with a chunk at least SUPPORTED_SIMILARITY similar
+      unsupported  - the sentences below that threshold
+    """
+    sentences = split_sentences(answer)
+    if not sentences or chunk_embeddings is None or len(chunk_embeddings) == 0:
+        return None
+    sentence_vectors = _normalize(model.encode(sentences, batch_size=32))
+    best = (sentence_vectors @ _normalize(chunk_embeddings).T).max(axis=1)
+    return {
+        "confidence": round(float(np.clip(best.mean(), 0.0, 1.0)), 4),
+        "faithfulness": round(float((best >= SUPPORTED_SIMILARITY).mean()), 4),
+        "sentences": len(sentences),
+        "unsupported": [sentence for sentence, score in zip(sentences, best) if score < SUPPORTED_SIMILARITY],
+    }
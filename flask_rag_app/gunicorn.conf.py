@@ -0,0 +1,31 @@
+import os
+import threading
+
+# === Configuration ===
+bind = os.environ.get("BIND", "0.0.0.0:8000")
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+worker_class = "gthread"
+threads = int(os.environ.get("THREADS_PER_WORKER", "4"))
+timeout = 600  # LLM generations on CPU can take minutes
+preload_app = True  # Load the embedding model before forking; workers share it copy-on-write
+
+# Torch threads per worker, so N workers don't oversubscribe the cores
+TORCH_THREADS_PER_WORKER = int(os.environ.get("TORCH_THREADS_PER_WORKER", max(1, (os.cpu_count() or 1) // workers)))
+
+def post_fork(server, worker):
+    """Give each worker its own connections and thread budget."""
+    import torch
+    from step3_document_embedding import model as ingest_model
+    from step5_retrieval import ollama_client, embed_model
+
+    torch.set_num_threads(TORCH_THREADS_PER_WORKER)
+    for embedder in (embed_model, ingest_model):
+        if hasattr(embedder, "num_threads"):  # ONNX backend: session is created lazily in each worker
+            embedder.num_threads = TORCH_THREADS_PER_WORKER
+    ollama_client.reset()
+
+def post_worker_init(worker):
+    """Warm up in the background; /ready reports 503 until it finishes."""
+    from app import warm_up
+
+    threading.Thread(target=warm_up, daemon=True).start()
@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from bench_workers import APP_DIR, wait_until_ready
+
+# === Configuration ===
+APP_PORT = 8766
+STUB_PORT = 11435
+COLLECTION_NAME = "oran_docs"
+EMBEDDING_MODEL_PATH = "/home/sswarna/models/all-MiniLM-L12-v2"
+LOAD_QUERIES = [
+    "Describe the architecture of O-RAN Near-RT RIC.",
+    "What is the role of the Non-RT RIC?",
+    "How does the E2 interface work?",
+    "What does the SMO manage over O1?",
+    "Explain the A1 policy workflow.",
+]
+FIXTURE_SENTENCES = [
+    "The Near-RT RIC hosts xApps that control RAN functions over the E2 interface.",
+    "The Non-RT RIC provides policy-based guidance to the Near-RT RIC over the A1 interface.",
+    "The SMO performs FCAPS management of O-RAN network functions through the O1 interface.",
+    "E2 Setup is initiated by the E2 Node to establish the E2 connection with the Near-RT RIC.",
+    "The O-DU terminates the open fronthaul interface towards the O-RU.",
+    "rApps run on the Non-RT RIC and use the R1 interface to access SMO services.",
+]
+
+
+# === Stub Ollama ===
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Answers /api/generate after `latency` seconds, then emits `tokens` tokens at `token_rate` per second."""
+
+    latency = 0.5
+    token_rate = 20.0
+    tokens = 100
+
+    def log_message(self, format, *args):
+        pass  # Keep the load test output readable
+
+    def _send_json(self, body, status=200):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self._send_json({"error": "not found"}, 404)
+            return
+        payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not payload.get("prompt"):  # Warm-up / unload requests only (un)load the model
+            self._send_json({"model": payload.get("model"), "response": "", "done": True, "done_reason": "load"})
+            return
+
+        time.sleep(self.latency)
+        token_delay = 1.0 / self.token_rate
+        stats = {
+            "done": True,
+            "prompt_eval_count": len(payload["prompt"].split()),
+            "prompt_eval_duration": int(self.latency * 1e9),
+            "eval_count": self.tokens,
+            "eval_duration": int(self.tokens * token_delay * 1e9),
+        }
+        if payload.get("stream", True):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.end_headers()
+            for i in range(self.tokens):
+                self.wfile.write((json.dumps({"response": f"tok{i} ", "done": False}) + "\n").encode("utf-8"))
+                self.wfile.flush()
+                time.sleep(token_delay)
+            self.wfile.write((json.dumps({"response": "", **stats}) + "\n").encode("utf-8"))
+            return
+        time.sleep(self.tokens * token_delay)
+        self._send_json({"model": payload.get("model"), "response": " ".join(f"tok{i}" for i in range(self.tokens)), **stats})
+
+
+def start_stub_ollama(port, latency, token_rate, tokens):
+    """Run the stub in a background thread; returns the server (call shutdown() to stop it)."""
+    handler = type("ConfiguredStubOllama", (StubOllamaHandler,),
+                   {"latency": latency, "token_rate": token_rate, "tokens": tokens})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# === Fixtures ===
+def build_fixture_store(chroma_db_dir, documents):
+    """Create a small Chroma index (`documents` synthetic specs) and activate it as the serving version."""
+    import chromadb
+    from embedding_backend import load_embedder
+    from index_versions import new_version_name, activate
+    from index_profiles import get_or_create_profiled_collection
+
+    model = load_embedder(EMBEDDING_MODEL_PATH)
+    client = chromadb.PersistentClient(path=chroma_db_dir)
+    version = new_version_name(COLLECTION_NAME)
+    collection = get_or_create_profiled_collection(client, version)
+
+    ids, texts, metadatas = [], [], []
+    for doc in range(documents):
+        title = f"O-RAN.WG{doc % 11 + 1}.FIXTURE-{doc:03d}-v01.00"
+        for i, sentence in enumerate(FIXTURE_SENTENCES):
+            ids.append(f"{title}_chunk_{i}")
+            texts.append(f"{sentence} (fixture document {doc}, section {i})")
+            metadatas.append({"title": title, "source": f"{title}.pdf", "token_length": len(sentence.split()),
+                              "embedding_model": "all-MiniLM-L12-v2", "chunk_type": "content"})
+    collection.upsert(ids=ids, documents=texts, metadatas=metadatas,
+                      embeddings=[vector.tolist() for vector in model.encode(texts, batch_size=64)])
+    activate(chroma_db_dir, version)
+    print(f"📦 Fixture store: {len(ids)} chunks from {documents} documents in {chroma_db_dir}")
+
+
+def scratch_env(work_dir, chroma_db_dir):
+    """Environment overrides that point every path the app touches at `work_dir` and its LLM at the stub."""
+    return {
+        "OLLAMA_URL": f"http://127.0.0.1:{STUB_PORT}/api/generate",
+        "CHROMA_DB_DIR": chroma_db_dir,
+        "OUTPUT_BASE_DIR": os.path.join(work_dir, "output"),
+        "UPLOAD_FOLDER": os.path.join(work_dir, "uploads"),
+        "EMBEDDING_CACHE_PATH": os.path.join(work_dir, "embedding_cache.sqlite"),
+    }
+
+
+def make_fixture_pdf(path, serial):
+    """A one-page PDF whose text differs per upload, so uploads aren't served from the embedding cache."""
+    import fitz  # PyMuPDF
+
+    doc = fitz.open()
+    page = doc.new_page()
+    page.insert_text((72, 72), f"1 Load test upload {serial}", fontsize=16)
+    y = 110
+    for sentence in FIXTURE_SENTENCES:
+        page.insert_text((72, y), f"{sentence} Upload {serial}.", fontsize=9)
+        y += 16
+    doc.save(path)
+    doc.close()
+
+
+# === Load generation ===
+def percentile(values, pct):
+    """Nearest-rank percentile of `values` (already sorted)."""
+    if not values:
+        return float("nan")
+    return values[min(len(values) - 1, max(0, round(pct / 100 * len(values)) - 1))]
+
+
+def run_level(base_url, concurrency, duration, upload_ratio, work_dir):
+    """Drive mixed /query and /upload traffic for `duration` seconds; returns endpoint -> [(ok, seconds)]."""
+    results = {"/query": [], "/upload": []}
+    results_lock = threading.Lock()
+    serial = iter(range(10 ** 9))
+    serial_lock = threading.Lock()
+    deadline = time.perf_counter() + duration
+
+    def user():
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            if random.random() < upload_ratio:
+                with serial_lock:
+                    n = next(serial)
+                pdf_path = os.path.join(work_dir, f"loadtest-upload-{concurrency}-{n}.pdf")
+                make_fixture_pdf(pdf_path, n)
+                endpoint = "/upload"
+                start = time.perf_counter()
+                try:
+                    with open(pdf_path, "rb") as f:
+                        ok = session.post(f"{base_url}/upload", files={"file": f}, timeout=900).status_code == 200
+                except requests.RequestException:
+                    ok = False
+            else:
+                endpoint = "/query"
+                start = time.perf_counter()
+                try:
+                    response = session.post(f"{base_url}/query", json={"query": random.choice(LOAD_QUERIES)}, timeout=900)
+                    ok = response.status_code == 200
+                except requests.RequestException:
+                    ok = False
+            elapsed = time.perf_counter() - start
+            with results_lock:
+                results[endpoint].append((ok, elapsed))
+
+    threads = [threading.Thread(target=user) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def report(rows):
+    """Print one markdown row per (concurrency, endpoint)."""
+    print("\n| Users | Endpoint | Requests | req/s | Errors | p50 (s) | p99 (s) |")
+    print("|---|---|---|---|---|---|---|")
+    for concurrency, endpoint, outcomes, duration in rows:
+        latencies = sorted(seconds for _, seconds in outcomes)
+        errors = sum(1 for ok, _ in outcomes if not ok)
+        error_rate = errors / len(outcomes) if outcomes else 0.0
+        print(f"| {concurrency} | {endpoint} | {len(outcomes)} | {len(outcomes) / duration:.2f} | {error_rate:.1%} "
+              f"| {percentile(latencies, 50):.2f} | {percentile(latencies, 99):.2f} |")
+
+
+def load_test(args):
+    work_dir = tempfile.mkdtemp(prefix="oran-loadtest-")
+    chroma_db_dir = os.path.join(work_dir, "chroma_index")
+    stub = start_stub_ollama(STUB_PORT, args.stub_latency, args.stub_token_rate, args.stub_tokens)
+    print(f"🤖 Stub Ollama on :{STUB_PORT} ({args.stub_latency}s latency, {args.stub_tokens} tokens at {args.stub_token_rate}/s)")
+    build_fixture_store(chroma_db_dir, args.fixture_docs)
+
+    # Point every path the app touches at the scratch directory
+    env = dict(os.environ, BIND=f"127.0.0.1:{APP_PORT}", WEB_CONCURRENCY=str(args.workers), **scratch_env(work_dir, chroma_db_dir))
+    log_path = os.path.join(work_dir, "app.log")
+    base_url = f"http://127.0.0.1:{APP_PORT}"
+    rows = []
+    with open(log_path, "w", encoding="utf-8") as log:
+        server = subprocess.Popen([sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "wsgi:app"],
+                                  cwd=APP_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            if not wait_until_ready(base_url, args.workers):
+                print(f"❌ App never became ready, see {log_path}")
+                return
+            for concurrency in args.concurrency:
+                print(f"🚦 {concurrency} concurrent user(s) for {args.duration}s ...")
+                results = run_level(base_url, concurrency, args.duration, args.upload_ratio, work_dir)
+                for endpoint, outcomes in results.items():
+                    if outcomes:
+                        rows.append((concurrency, endpoint, outcomes, args.duration))
+        finally:
+            server.terminate()
+            server.wait()
+            stub.shutdown()
+
+    report(rows)
+    if args.keep:
+        print(f"📂 Scratch directory kept: {work_dir}")
+    else:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load-test /query and /upload against a stub LLM and a fixture store.")
+    parser.add_argument("--concurrency", default="1,4,16", help="Comma-separated numbers of concurrent users")
+    parser.add_argument("--duration", type=float, default=30, help="Seconds of traffic per concurrency level")
+    parser.add_argument("--upload-ratio", type=float, default=0.05, help="Share of requests that are uploads")
+    parser.add_argument("--workers", type=int, default=2, help="gunicorn workers")
+    parser.add_argument("--stub-latency", type=float, default=0.5, help="Stub LLM seconds before the first token")
+    parser.add_argument("--stub-token-rate", type=float, default=20.0, help="Stub LLM tokens per second")
+    parser.add_argument("--stub-tokens", type=int, default=100, help="Tokens per stub answer")
+    parser.add_argument("--fixture-docs", type=int, default=50, help="Synthetic documents in the fixture store")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory (logs, store, uploads)")
+    args = parser.parse_args()
+    args.concurrency = [int(n) for n in args.concurrency.split(",")]
+    load_test(args)
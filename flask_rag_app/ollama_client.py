@@ -0,0 +1,209 @@
+import os
+import time
+import hashlib
+import json
+import argparse
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# === Configuration ===
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434/api/generate")
+OLLAMA_MODEL = "llama2:7b"
+OLLAMA_KEEP_ALIVE = "30m"  # Keep the model resident between sparse requests
+CONNECT_TIMEOUT = 5  # Seconds to establish the connection
+READ_TIMEOUT = 300  # Seconds to wait for a non-streamed generation
+MAX_RETRIES = 2  # Retries on connection errors and 502/503/504 (never on read timeouts)
+POOL_SIZE = 8  # Keep-alive connections held open to Ollama
+MAX_IN_FLIGHT = 4  # Concurrent generations sent upstream
+QUEUE_WAIT = 0.5  # Seconds a request may wait for a free slot before being rejected
+
+
+class OllamaBusyError(RuntimeError):
+    """Raised when every in-flight slot is taken and the wait for one times out."""
+
+
+class _Call:
+    """A single upstream generation shared by every caller with the same payload."""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class OllamaClient:
+    """Pooled Ollama client with bounded concurrency and single-flight coalescing."""
+
+    def __init__(self, url=OLLAMA_URL, model=OLLAMA_MODEL, keep_alive=OLLAMA_KEEP_ALIVE,
+                 max_in_flight=MAX_IN_FLIGHT, queue_wait=QUEUE_WAIT,
+                 timeout=(CONNECT_TIMEOUT, READ_TIMEOUT), retries=MAX_RETRIES, pool_size=POOL_SIZE):
+        self.url = url
+        self.model = model
+        self.keep_alive = keep_alive
+        self.timeout = timeout
+        self.queue_wait = queue_wait
+        self._retries = retries
+        self._pool_size = pool_size
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.session = self._new_session()
+
+    def _new_session(self):
+        """Create a keep-alive session that retries transient upstream failures."""
+        retry = Retry(
+            total=self._retries,
+            read=0,  # A read timeout means the generation ran; replaying it would multiply READ_TIMEOUT
+            backoff_factor=0.5,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset({"POST"}),  # /api/generate is safe to replay
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._pool_size, max_retries=retry)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def reset(self):
+        """Drop pooled connections and in-flight state; call in a freshly forked worker."""
+        self._lock = threading.Lock()
+        self._calls = {}
+        self.session = self._new_session()
+
+    def _post(self, payload):
+        """Send one request upstream, holding an in-flight slot for its duration."""
+        if not self._slots.acquire(timeout=self.queue_wait):
+            raise OllamaBusyError("Ollama is at capacity, try again shortly.")
+        try:
+            response = self.session.post(self.url, json=payload, timeout=self.timeout)
+            response.raise_for_status()
+            return response.json()
+        finally:
+            self._slots.release()
+
+    def generate(self, prompt, model=None, options=None, system=None):
+        """Return Ollama's JSON reply for `prompt`, coalescing identical concurrent calls.
+
+        Fixed instructions belong in `system`: the chat template renders it first, so it forms a
+        prefix Ollama can reuse from its prompt cache instead of re-evaluating it on every call.
+        """
+        payload = {
+            "model": model or self.model,
+            "prompt": prompt,
+            "stream": False,
+            "keep_alive": self.keep_alive,
+        }
+        if system:
+            payload["system"] = system
+        if options:
+            payload["options"] = options
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = self._post(payload)
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result
+
+    def warm_up(self, model=None):
+        """Load the model into memory (a prompt-less request) and return the seconds it took."""
+        start = time.perf_counter()
+        self._post({"model": model or self.model, "keep_alive": self.keep_alive})
+        return time.perf_counter() - start
+
+    def unload(self, model=None):
+        """Evict the model from Ollama's memory, e.g. to measure a cold start."""
+        self._post({"model": model or self.model, "keep_alive": 0})
+
+    def time_to_first_token(self, prompt, model=None, system=None):
+        """Stream one generation and return (seconds to first token, Ollama's final stats).
+
+        Raises RuntimeError if Ollama reports an error or the generation produces no token.
+        """
+        payload = {"model": model or self.model, "prompt": prompt, "stream": True, "keep_alive": self.keep_alive}
+        if system:
+            payload["system"] = system
+        if not self._slots.acquire(timeout=self.queue_wait):
+            raise OllamaBusyError("Ollama is at capacity, try again shortly.")
+        try:
+            start = time.perf_counter()
+            first_token = None
+            stats = {}
+            with self.session.post(self.url, json=payload, timeout=self.timeout, stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines():
+                    if not line:
+                        continue
+                    message = json.loads(line)
+                    if message.get("error"):
+                        raise RuntimeError(f"Ollama stream failed: {message['error']}")
+                    if first_token is None and message.get("response"):
+                        first_token = time.perf_counter() - start
+                    if message.get("done"):
+                        stats = message
+            if first_token is None:
+                raise RuntimeError(f"Ollama returned no tokens for {payload['model']} (empty generation)")
+            return first_token, stats
+        finally:
+            self._slots.release()
+
+
+def timing_summary(reply):
+    """One-line summary of Ollama's durations (reported in nanoseconds) for a non-streamed reply."""
+    def seconds(field):
+        return reply.get(field, 0) / 1e9
+
+    return (f"load {seconds('load_duration'):.2f}s, prompt {reply.get('prompt_eval_count', 0)} tokens "
+            f"in {seconds('prompt_eval_duration'):.2f}s, {reply.get('eval_count', 0)} tokens "
+            f"in {seconds('eval_duration'):.2f}s")
+
+
+def measure_ttft(client, prompt, system=None, runs=3):
+    """Time-to-first-token with the model unloaded (cold) and then resident (warm)."""
+    client.unload()
+    cold, cold_stats = client.time_to_first_token(prompt, system=system)
+    print(f"🥶 Cold TTFT: {cold:.2f}s (model load {cold_stats.get('load_duration', 0) / 1e9:.2f}s)")
+
+    warm = []
+    for _ in range(runs):
+        ttft, stats = client.time_to_first_token(prompt, system=system)
+        warm.append(ttft)
+        print(f"🔥 Warm TTFT: {ttft:.2f}s ({stats.get('prompt_eval_count', 0)} prompt tokens evaluated)")
+    warm_median = sorted(warm)[len(warm) // 2]
+    print(f"📊 Cold {cold:.2f}s vs warm median {warm_median:.2f}s: warm-up saves {cold - warm_median:.2f}s on the first query")
+    return cold, warm
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure Ollama time-to-first-token, cold vs. warm.")
+    parser.add_argument("--model", default=OLLAMA_MODEL)
+    parser.add_argument("--prompt", default="What does the Near-RT RIC do?")
+    parser.add_argument("--system", default=None, help="System instructions, sent as the reusable prefix")
+    parser.add_argument("--runs", type=int, default=3, help="Warm generations to time")
+    args = parser.parse_args()
+    try:
+        measure_ttft(OllamaClient(model=args.model), args.prompt, system=args.system, runs=args.runs)
+    except (RuntimeError, requests.RequestException) as e:
+        raise SystemExit(f"❌ TTFT measurement failed: {e}")
@@ -5,9 +5,10 @@ import fitz  # PyMuPDF
 import docx
 from tqdm import tqdm
 import tiktoken  # <-- Added for token-based splitting
+from chunk_io import artifact_path, write_artifact
 
 # === Configuration ===
-OUTPUT_BASE_DIR = "/home/sswarna/Documents/oran_docs/output_all"
+OUTPUT_BASE_DIR = os.environ.get("OUTPUT_BASE_DIR", "/home/sswarna/Documents/oran_docs/output_all")  # Overridable, e.g. by load_test.py
 CHUNKS_OUTPUT_BASE_DIR = os.path.join(OUTPUT_BASE_DIR, "Step2_chunks")
 os.makedirs(CHUNKS_OUTPUT_BASE_DIR, exist_ok=True)
 
@@ -22,6 +23,7 @@ def extract_text_from_pdf(pdf_path):
     try:
         doc = fitz.open(pdf_path)
         metadata = doc.metadata  # Extract metadata
+        metadata["page_count"] = doc.page_count
         for page in doc:
             text += page.get_text("text") + "\n"
         text = clean_text(text)
@@ -46,26 +48,228 @@ def adaptive_chunking(text, chunk_size=512, overlap=100, encoding_name="gpt2"):
     encoding = tiktoken.get_encoding(encoding_name)
     tokens = encoding.encode(text)
 
-    chunks = []
     index = 0
     chunk_index = 0
     
+    # Yielded one at a time so chunks stream straight into the output artifact
     while index < len(tokens):
         end = min(index + chunk_size, len(tokens))
         chunk_tokens = tokens[index:end]
         chunk_text = encoding.decode(chunk_tokens)
         
-        chunks.append({
+        yield {
             "chunk_index": chunk_index,
             "chunk_content": chunk_text
-        })
+        }
         
         chunk_index += 1
         index += (chunk_size - overlap)
         if index <= 0:
             break
-    
-    return chunks
+
+# === Structure-aware chunking (PDF outline / heading detection) ===
+CHUNKING_MODE = "structure"  # "structure": split on PDF sections; "fixed": 512-token windows with 100-token overlap
+MIN_SECTION_TOKENS = 128  # Smaller sections are merged with the ones that follow
+MAX_SECTION_TOKENS = 512  # Larger sections are sub-split, with overlap only at these forced splits
+SPLIT_OVERLAP = 100
+HEADING_SIZE_RATIO = 1.15  # Fallback heading detection: font this much larger than body text
+MAX_HEADING_CHARS = 120
+
+def detect_headings(doc):
+    """Guess (level, title, page_index) headings from font sizes when a PDF has no outline."""
+    lines = []
+    size_weights = {}
+    for page_index, page in enumerate(doc):
+        for block in page.get_text("dict")["blocks"]:
+            for line in block.get("lines", []):
+                spans = [span for span in line["spans"] if span["text"].strip()]
+                if not spans:
+                    continue
+                line_text = " ".join(span["text"].strip() for span in spans)
+                size = round(max(span["size"] for span in spans), 1)
+                lines.append((page_index, line_text, size))
+                size_weights[size] = size_weights.get(size, 0) + len(line_text)
+
+    if not size_weights:
+        return []
+    body_size = max(size_weights, key=size_weights.get)  # Font size carrying the most text
+    heading_sizes = sorted({size for _, _, size in lines if size >= body_size * HEADING_SIZE_RATIO}, reverse=True)
+    levels = {size: level + 1 for level, size in enumerate(heading_sizes)}
+
+    return [
+        (levels[size], line_text, page_index)
+        for page_index, line_text, size in lines
+        if size in levels and len(line_text) <= MAX_HEADING_CHARS
+    ]
+
+def find_heading(page_text, title):
+    """Character offset of `title` in the raw `page_text`; 0 (page start) if it can't be found.
+
+    Titles wrapped across lines or differently cased are matched word by word with any whitespace
+    between, so the offset is still a position in the raw text.
+    """
+    offset = page_text.find(title)
+    if offset >= 0:
+        return offset
+    words = title.split()
+    if not words:
+        return 0
+    match = re.search(r"\s+".join(re.escape(word) for word in words), page_text, re.IGNORECASE)
+    return match.start() if match else 0
+
+def extract_sections_from_pdf(pdf_path):
+    """Split a PDF into sections: dicts with section_path, page_start, page_end (1-based) and text."""
+    try:
+        doc = fitz.open(pdf_path)
+        pages = [page.get_text("text") for page in doc]
+        headings = [(level, title.strip(), page - 1) for level, title, page in doc.get_toc(simple=True) if page >= 1]
+        if not headings:
+            headings = detect_headings(doc)
+    except Exception as e:
+        print(f"❌ Error reading PDF structure: {pdf_path} - {e}")
+        return []
+
+    # Locate each heading inside its page so sections can start mid-page
+    boundaries = [(0, 0, "")]  # (page_index, char_offset, section_path); leading front matter has no path
+    path_stack = []
+    for level, title, page_index in headings:
+        if page_index >= len(pages):
+            continue
+        offset = find_heading(pages[page_index], title)
+        if (page_index, offset) < boundaries[-1][:2]:
+            continue  # Outline entries out of page order: keep sections contiguous
+        path_stack = path_stack[:level - 1] + [title]  # Only headings that start a section enter the path
+        boundaries.append((page_index, offset, " > ".join(path_stack)))
+
+    sections = []
+    for i, (page_index, offset, section_path) in enumerate(boundaries):
+        end_page, end_offset = boundaries[i + 1][:2] if i + 1 < len(boundaries) else (len(pages) - 1, None)
+        if end_offset == 0 and end_page > page_index:
+            end_page, end_offset = end_page - 1, None  # Next section starts at the top of a page: this one ends a page earlier
+        if page_index == end_page:
+            text = pages[page_index][offset:end_offset]
+        else:
+            text = pages[page_index][offset:] + "\n" + "\n".join(pages[page_index + 1:end_page])
+            text += "\n" + pages[end_page][:end_offset]
+        text = clean_text(text)
+        if text.strip():
+            sections.append({
+                "section_path": section_path,
+                "page_start": page_index + 1,
+                "page_end": end_page + 1,
+                "text": text,
+            })
+    return sections
+
+def top_level(section_path):
+    """The top-level heading of a `section_path` ("" for front matter)."""
+    return section_path.split(" > ", 1)[0]
+
+def structure_aware_chunking(sections, min_tokens=MIN_SECTION_TOKENS, max_tokens=MAX_SECTION_TOKENS,
+                             overlap=SPLIT_OVERLAP, encoding_name="gpt2"):
+    """Chunk on section boundaries: merge small sections, sub-split large ones with overlap."""
+    encoding = tiktoken.get_encoding(encoding_name)
+
+    # Merge runs of small sections into the section that starts the run, never across top-level headings
+    merged = []
+    for section in sections:
+        tokens = encoding.encode(section["text"])
+        previous = merged[-1] if merged else None
+        if (previous and len(previous["tokens"]) < min_tokens and len(previous["tokens"]) + len(tokens) <= max_tokens
+                and top_level(previous["paths"][0]) == top_level(section["section_path"])):
+            previous["tokens"] += encoding.encode("\n") + tokens
+            previous["page_end"] = section["page_end"]
+            if section["section_path"] not in previous["paths"]:
+                previous["paths"].append(section["section_path"])
+        else:
+            merged.append(dict(section, tokens=tokens, paths=[section["section_path"]]))
+
+    chunk_index = 0
+    for section in merged:
+        tokens = section["tokens"]
+        starts = [0] if len(tokens) <= max_tokens else range(0, len(tokens) - overlap, max_tokens - overlap)
+        for start in starts:
+            yield {
+                "chunk_index": chunk_index,
+                "chunk_content": encoding.decode(tokens[start:start + max_tokens]),
+                "section_path": " | ".join(section["paths"]),  # Every section merged into the chunk
+                "page_start": section["page_start"],
+                "page_end": section["page_end"],
+            }
+            chunk_index += 1
+
+def fixed_chunking_cost(token_count, chunk_size=512, overlap=100):
+    """(chunks, tokens) that adaptive_chunking would produce for a text of `token_count` tokens."""
+    starts = range(0, token_count, chunk_size - overlap)
+    return len(starts), sum(min(chunk_size, token_count - start) for start in starts)
+
+def make_chunks(input_path, text, filename):
+    """Yield a document's chunks using CHUNKING_MODE, reporting savings against fixed windows."""
+    if CHUNKING_MODE != "structure" or not input_path.lower().endswith(".pdf"):
+        yield from adaptive_chunking(text, chunk_size=512, overlap=100)
+        return
+
+    sections = extract_sections_from_pdf(input_path)
+    if not sections:
+        yield from adaptive_chunking(text, chunk_size=512, overlap=100)
+        return
+
+    encoding = tiktoken.get_encoding("gpt2")
+    chunk_count = 0
+    structure_tokens = 0
+    for chunk in structure_aware_chunking(sections):
+        chunk_count += 1
+        structure_tokens += len(encoding.encode(chunk["chunk_content"]))
+        yield chunk
+
+    fixed_chunks, fixed_tokens = fixed_chunking_cost(len(encoding.encode(text)))
+    # The embedder truncates every chunk to its max sequence length, so embed time tracks chunk count
+    print(f"📉 {filename}: {chunk_count} section chunks vs {fixed_chunks} fixed "
+          f"({1 - chunk_count / max(fixed_chunks, 1):.0%} fewer, ~same cut in embed time), "
+          f"{structure_tokens} vs {fixed_tokens} tokens stored")
+
+# === Boilerplate classification (runs once at ingestion, instead of per query) ===
+DROP_BOILERPLATE = False  # True: don't emit boilerplate chunks at all; False: keep them, tagged
+IPR_PATTERN = re.compile(r"(?i)\b(IPR|intellectual property rights?|essential patents?|patents?|trademarks?|terms of use)\b")
+COPYRIGHT_PATTERN = re.compile(r"(?i)(copyright|©|all rights reserved|reproduction is (?:prohibited|permitted))")
+TOC_HEADING_PATTERN = re.compile(r"(?i)\b(table of contents|contents|list of figures|list of tables)\b")
+TOC_ENTRY_PATTERN = re.compile(r"(?i)^\s*(?:\d+(?:\.\d+)*|annex\s+[a-z](?:\.\d+)*)\s+\S.{0,100}?\s\d{1,4}\s*$")
+SECTION_NUMBER_PATTERN = re.compile(r"(?i)^\s*(?:\d+(?:\.\d+)*|annex\s+[a-z](?:\.\d+)*)\s+\S")
+DOTTED_LEADER_PATTERN = re.compile(r"(?:\.\s?){4,}|…{2,}|(?:_\s?){4,}")
+
+def classify_chunk(text):
+    """Tag a chunk as "content" or one of "ipr", "copyright", "toc", "dotted_leader", "empty"."""
+    lines = [line for line in text.splitlines() if line.strip()]
+    if not lines:
+        return "empty"  # Whitespace only: boilerplate like the other non-content tags
+    words = max(len(text.split()), 1)
+
+    # Lines that are mostly dot/underscore leaders
+    leader_lines = sum(1 for line in lines if DOTTED_LEADER_PATTERN.search(line))
+    if leader_lines / len(lines) >= 0.3:
+        return "dotted_leader"
+
+    # Numbered headings with a trailing page number, or a run of bare section numbers under a "Contents" heading
+    toc_entries = sum(1 for line in lines if TOC_ENTRY_PATTERN.match(line))
+    numbered = sum(1 for line in lines if SECTION_NUMBER_PATTERN.match(line))
+    if toc_entries / len(lines) >= 0.4 or (TOC_HEADING_PATTERN.search(text) and numbered / len(lines) >= 0.3):
+        return "toc"
+
+    # Legal notices: keyword density per 100 words
+    if len(COPYRIGHT_PATTERN.findall(text)) * 100 / words >= 1.0:
+        return "copyright"
+    if len(IPR_PATTERN.findall(text)) * 100 / words >= 1.5:
+        return "ipr"
+
+    return "content"
+
+def tag_chunks(chunks):
+    """Record `chunk_type` on each chunk, dropping boilerplate when DROP_BOILERPLATE is set."""
+    for chunk in chunks:
+        chunk["chunk_type"] = classify_chunk(chunk["chunk_content"])
+        if DROP_BOILERPLATE and chunk["chunk_type"] != "content":
+            continue
+        yield chunk
 
 # === Process only the uploaded file ===
 def process_uploaded_file(uploaded_file_path):
@@ -100,22 +304,10 @@ def process_uploaded_file(uploaded_file_path):
     # 2. Save full text and metadata
     text_output_path = os.path.join(OUTPUT_BASE_DIR, f"{file_base_name}_text.json")
     with open(text_output_path, "w", encoding="utf-8") as f:
-        json.dump({"title": file_base_name, "text": text, "metadata": metadata}, f, indent=4)
-
-    # 3. Create token-based chunks
-    chunks = adaptive_chunking(text, chunk_size=512, overlap=100)
+        json.dump({"title": file_base_name, "text": text, "metadata": metadata}, f)
 
-    # 4. Save chunks in a JSON file (split if > 5000)
-    chunk_output_path = os.path.join(CHUNKS_OUTPUT_BASE_DIR, f"{file_base_name}_chunks.json")
-
-    if len(chunks) > 5000:
-        for i in range(0, len(chunks), 2000):
-            part_num = (i // 2000) + 1
-            part_path = chunk_output_path.replace("_chunks.json", f"_chunks_part{part_num}.json")
-            with open(part_path, "w", encoding="utf-8") as f:
-                json.dump({"title": file_base_name, "chunks": chunks[i:i + 2000]}, f, indent=4)
-        print(f"✅ Processed & Split: {filename} | {len(chunks)} chunks → Multiple files")
-    else:
-        with open(chunk_output_path, "w", encoding="utf-8") as f:
-            json.dump({"title": file_base_name, "chunks": chunks}, f, indent=4)
-        print(f"✅ Processed: {filename} | {len(chunks)} chunks created")
+    # 3 & 4. Stream section-aware (or fixed token) chunks, tagged as content or boilerplate,
+    # straight into a (compressed) JSONL artifact: no in-memory chunk list, no size-based splitting
+    chunk_output_path = artifact_path(os.path.join(CHUNKS_OUTPUT_BASE_DIR, f"{file_base_name}_chunks"))
+    chunk_count = write_artifact(chunk_output_path, {"title": file_base_name}, tag_chunks(make_chunks(uploaded_file_path, text, filename)))
+    print(f"✅ Processed: {filename} | {chunk_count} chunks created")
@@ -1,57 +1,65 @@
 import os
-import json
-from sentence_transformers import SentenceTransformer
+import time
+from embedding_backend import EMBEDDING_BACKEND, load_embedder
 from tqdm import tqdm
+from embedding_cache import EmbeddingCache
+from chunk_io import read_artifact, write_artifact, artifact_path, artifact_document_name, find_document_artifact, iter_batches
 
 # === Configuration ===
-CHUNKS_INPUT_BASE_DIR = "/home/sswarna/Documents/oran_docs/output_all/Step2_chunks"
-EMBEDDINGS_OUTPUT_BASE_DIR = "/home/sswarna/Documents/oran_docs/output_all/Step3_Embeddings"
+OUTPUT_BASE_DIR = os.environ.get("OUTPUT_BASE_DIR", "/home/sswarna/Documents/oran_docs/output_all")
+CHUNKS_INPUT_BASE_DIR = os.path.join(OUTPUT_BASE_DIR, "Step2_chunks")
+EMBEDDINGS_OUTPUT_BASE_DIR = os.path.join(OUTPUT_BASE_DIR, "Step3_Embeddings")
 MODEL_PATH = "/home/sswarna/models/all-MiniLM-L12-v2"
+EMBED_BATCH_SIZE = 256  # Chunks read, embedded and written per batch
 
 os.makedirs(EMBEDDINGS_OUTPUT_BASE_DIR, exist_ok=True)
 
-# Load locally stored embedding model
-model = SentenceTransformer(MODEL_PATH)
+# Load locally stored embedding model (PyTorch or ONNX Runtime, see embedding_backend.py)
+model = load_embedder(MODEL_PATH)
+
+# Model and backend, e.g. "all-MiniLM-L12-v2:onnx-int8": stored on every row, so vectors from
+# different backends can be told apart in the index
+EMBEDDING_MODEL_NAME = f"{os.path.basename(MODEL_PATH)}:{EMBEDDING_BACKEND}"
+
+# Embeddings of unchanged chunk texts are reused across runs and uploads (int8 vectors are cached separately)
+embedding_cache = EmbeddingCache(EMBEDDING_MODEL_NAME)
 
 def process_file(input_filepath, output_filepath):
-    """Process a chunk file, generate embeddings, and save results."""
+    """Stream a chunk artifact through the embedder into an embeddings artifact."""
     if not os.path.exists(input_filepath):
         print(f"⚠️ ERROR: File not found: {input_filepath}")
         return
 
-    with open(input_filepath, "r", encoding="utf-8") as f:
-        chunks_data = json.load(f)
-
-    if "chunks" not in chunks_data or not isinstance(chunks_data["chunks"], list):
-        print(f"❌ ERROR: Expected a list in {input_filepath}, but got {type(chunks_data)}")
-        return
-
     # Extract title (ensuring backward compatibility)
-    title = chunks_data.get("title", os.path.basename(input_filepath).replace("_chunks.json", ""))
-
-    embeddings_data = []
-    for chunk in tqdm(chunks_data["chunks"], desc=f"Processing {os.path.basename(input_filepath)}"):
-        if "chunk_content" not in chunk:
-            continue
-
-        chunk_text = chunk["chunk_content"]
-        embedding_vector = model.encode(chunk_text).tolist()
-
-        embeddings_data.append({
-            "title": title,  # <-- Preserve title in embeddings output
-            "chunk_index": chunk["chunk_index"],
-            "chunk_content": chunk_text,
-            "embedding": embedding_vector,
-            "token_length": len(chunk_text.split()),
-            "source_file": os.path.basename(input_filepath).replace("_chunks.json", ""),
-            "embedding_model": "all-MiniLM-L12-v2"
-        })
-
-    # Save the embeddings
-    with open(output_filepath, "w", encoding="utf-8") as f:
-        json.dump(embeddings_data, f, indent=4)
-
-    print(f"✅ Processed: {input_filepath} → {output_filepath}")
+    header, chunk_records = read_artifact(input_filepath)
+    source_file = artifact_document_name(os.path.basename(input_filepath), "chunks")
+    title = header.get("title") or source_file
+
+    def embedded_records():
+        chunks = (chunk for chunk in chunk_records if "chunk_content" in chunk)
+        for batch in iter_batches(chunks, EMBED_BATCH_SIZE):
+            vectors = embedding_cache.embed(model, [chunk["chunk_content"] for chunk in batch])
+            for chunk, embedding_vector in zip(batch, vectors):
+                chunk_text = chunk["chunk_content"]
+                yield {
+                    "title": title,  # <-- Preserve title in embeddings output
+                    "chunk_index": chunk["chunk_index"],
+                    "chunk_content": chunk_text,
+                    "embedding": embedding_vector,
+                    "token_length": len(chunk_text.split()),
+                    "source_file": source_file,
+                    "embedding_model": EMBEDDING_MODEL_NAME,
+                    "chunk_type": chunk.get("chunk_type", "content"),
+                    "section_path": chunk.get("section_path"),  # Set by structure-aware chunking only
+                    "page_start": chunk.get("page_start"),
+                    "page_end": chunk.get("page_end")
+                }
+
+    # Save the embeddings as they are produced
+    start_time = time.perf_counter()
+    count = write_artifact(output_filepath, {"title": title}, tqdm(embedded_records(), desc=f"Processing {os.path.basename(input_filepath)}"))
+    elapsed = time.perf_counter() - start_time
+    print(f"✅ Processed: {input_filepath} → {output_filepath} | {count} chunks embedded in {elapsed:.1f}s")
 
 # === Process only the uploaded file ===
 def process_uploaded_embedding(uploaded_file_path):
@@ -66,12 +74,13 @@ def process_uploaded_embedding(uploaded_file_path):
 
     print(f"\n🔹 Processing Uploaded File for Embeddings: {filename}\n")
 
-    input_filepath = os.path.join(CHUNKS_INPUT_BASE_DIR, f"{file_base_name}_chunks.json")
-    output_filepath = os.path.join(EMBEDDINGS_OUTPUT_BASE_DIR, f"{file_base_name}_embeddings.json")
+    input_filepath = find_document_artifact(CHUNKS_INPUT_BASE_DIR, file_base_name, "chunks")
+    output_filepath = artifact_path(os.path.join(EMBEDDINGS_OUTPUT_BASE_DIR, f"{file_base_name}_embeddings"))
 
-    if not os.path.exists(input_filepath):
-        print(f"⚠️ ERROR: Chunked file not found: {input_filepath}. Skipping embeddings.")
+    if input_filepath is None:
+        print(f"⚠️ ERROR: Chunked file not found for {file_base_name} in {CHUNKS_INPUT_BASE_DIR}. Skipping embeddings.")
         return
 
     # Process embeddings for this file
     process_file(input_filepath, output_filepath)
+    print(embedding_cache.report())
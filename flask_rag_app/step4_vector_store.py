@@ -1,18 +1,36 @@
 import os
-import json
-import chromadb
 from tqdm import tqdm
+from sharding import shard_key, shard_collection_name, open_shards, prune_stale_chunks
+from index_versions import serving_index
+from title_index import add_titles
+from index_profiles import get_or_create_profiled_collection
+from chunk_io import read_artifact, find_document_artifact, iter_batches
 
 # === Configuration ===
-EMBEDDINGS_INPUT_DIR = "/home/sswarna/Documents/oran_docs/output_all/Step3_Embeddings"
-CHROMA_DB_DIR = "/home/sswarna/Documents/oran_docs/oran_rag_pipeline/chroma_index"
+EMBEDDINGS_INPUT_DIR = os.path.join(os.environ.get("OUTPUT_BASE_DIR", "/home/sswarna/Documents/oran_docs/output_all"), "Step3_Embeddings")
+CHROMA_DB_DIR = os.environ.get("CHROMA_DB_DIR", "/home/sswarna/Documents/oran_docs/oran_rag_pipeline/chroma_index")
 COLLECTION_NAME = "oran_docs"
-
-# Initialize ChromaDB
-chroma_client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
-
-# Create or get collection
-collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
+UPSERT_BATCH_SIZE = 256  # Rows written to Chroma per call
+
+# ChromaDB is opened lazily, once per worker process (its SQLite handles must not cross a fork).
+# Uploads are written to the active index version, shared with the query path in step5.
+serving = serving_index(CHROMA_DB_DIR, COLLECTION_NAME)
+_collections = {}
+_collections_generation = None
+
+def get_chroma_client():
+    """Return this process's ChromaDB client, opening it on first use."""
+    return serving.client()
+
+def get_collection(key=None):
+    """Return the active version's collection for shard `key`, creating it on first use."""
+    global _collections_generation
+    if _collections_generation != serving.generation:
+        _collections.clear()  # Handles from before an index swap belong to the released client
+        _collections_generation = serving.generation
+    if key not in _collections:
+        _collections[key] = get_or_create_profiled_collection(get_chroma_client(), shard_collection_name(serving.version, key))
+    return _collections[key]
 
 def store_embeddings(input_filepath):
     """Stores embeddings for a single uploaded file in ChromaDB."""
@@ -20,35 +38,59 @@ def store_embeddings(input_filepath):
         print(f"⚠️ ERROR: File not found: {input_filepath}")
         return
 
-    with open(input_filepath, "r", encoding="utf-8") as f:
-        embedding_data = json.load(f)
+    _, embedding_records = read_artifact(input_filepath)
 
     print(f"\n📂 Processing File: {os.path.basename(input_filepath)}")
 
-    for chunk in tqdm(embedding_data, desc=f"Storing {os.path.basename(input_filepath)}"):
-        chunk_id = f"{chunk['title']}_chunk_{chunk['chunk_index']}"
-        embedding_vector = chunk.get("embedding")
-
-        
-        metadata = {
-            "title": chunk.get("title", "Unknown"),
-            "source": chunk.get("source_file", "Unknown"),
-            "token_length": chunk.get("token_length", 0),
-            "embedding_model": chunk.get("embedding_model", "Unknown Model"),
-        }
-
-        if embedding_vector and isinstance(embedding_vector, list):
-            collection.add(
-                ids=[chunk_id],
-                embeddings=[embedding_vector],
-                metadatas=[metadata],
-                documents=[chunk.get("chunk_content", "")]
-            )
-        else:
-            print(f"⚠️ Skipped chunk {chunk_id} due to missing or invalid embedding.")
+    serving.refresh()
+    with serving.guard.reading():
+        written_ids = _store_records(input_filepath, embedding_records)
+        collections = open_shards(get_chroma_client(), serving.version)
+        stale = prune_stale_chunks(collections, written_ids)
+        if stale:
+            print(f"🧹 Removed {stale} chunks left from a previous, longer upload")
+        # Make the new title resolvable by name in every worker (they reload the index on change)
+        add_titles(CHROMA_DB_DIR, serving.version, written_ids.keys(), collections)
 
     print("✅ Step 4: Vector Store Updated Successfully!")
 
+def _store_records(input_filepath, embedding_records):
+    """Upsert embedding records into the active version, grouped by shard; returns title -> chunk IDs stored."""
+    written_ids = {}
+    for batch in tqdm(iter_batches(embedding_records, UPSERT_BATCH_SIZE), desc=f"Storing {os.path.basename(input_filepath)}"):
+        rows_by_shard = {}
+        for chunk in batch:
+            chunk_id = f"{chunk['title']}_chunk_{chunk['chunk_index']}"
+            embedding_vector = chunk.get("embedding")
+
+            metadata = {
+                "title": chunk.get("title", "Unknown"),
+                "source": chunk.get("source_file", "Unknown"),
+                "token_length": chunk.get("token_length", 0),
+                "embedding_model": chunk.get("embedding_model", "Unknown Model"),
+                "chunk_type": chunk.get("chunk_type", "content"),  # Boilerplate is tagged at ingestion
+            }
+            # Section path and pages from structure-aware chunking (Chroma rejects None values)
+            for field in ("section_path", "page_start", "page_end"):
+                if chunk.get(field) is not None:
+                    metadata[field] = chunk[field]
+
+            if embedding_vector and isinstance(embedding_vector, list):
+                rows = rows_by_shard.setdefault(shard_key(metadata["title"]), {"ids": [], "embeddings": [], "metadatas": [], "documents": []})  # Uploads carry no year
+                rows["ids"].append(chunk_id)
+                rows["embeddings"].append(embedding_vector)
+                rows["metadatas"].append(metadata)
+                rows["documents"].append(chunk.get("chunk_content", ""))
+                written_ids.setdefault(metadata["title"], set()).add(chunk_id)
+            else:
+                print(f"⚠️ Skipped chunk {chunk_id} due to missing or invalid embedding.")
+
+        # Upsert, so re-uploading a revised spec replaces its chunks instead of being ignored
+        for key, rows in rows_by_shard.items():
+            get_collection(key).upsert(**rows)
+
+    return written_ids
+
 # === Process only the uploaded file ===
 def process_uploaded_vector_store(uploaded_file_path):
     """Processes only the uploaded file embeddings into ChromaDB."""
@@ -62,10 +104,10 @@ def process_uploaded_vector_store(uploaded_file_path):
 
     print(f"\n🔹 Storing Uploaded File in Vector Store: {filename}\n")
 
-    input_filepath = os.path.join(EMBEDDINGS_INPUT_DIR, f"{file_base_name}_embeddings.json")
+    input_filepath = find_document_artifact(EMBEDDINGS_INPUT_DIR, file_base_name, "embeddings")
 
-    if not os.path.exists(input_filepath):
-        print(f"⚠️ ERROR: Embeddings file not found: {input_filepath}. Skipping vector storage.")
+    if input_filepath is None:
+        print(f"⚠️ ERROR: Embeddings file not found for {file_base_name} in {EMBEDDINGS_INPUT_DIR}. Skipping vector storage.")
         return
 
     
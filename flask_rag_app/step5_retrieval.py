@@ -1,78 +1,119 @@
+import os
 import requests
 import json
-import chromadb
-import re
-from sentence_transformers import SentenceTransformer
-from Levenshtein import ratio  # Install with: pip install python-Levenshtein
+from embedding_backend import load_embedder
+from ollama_client import OllamaClient, OllamaBusyError, timing_summary
+from sharding import open_shards, fan_out_query, format_latencies, content_filter
+from index_versions import serving_index
+from title_index import ServingTitleIndex, stored_in
+from grounding import grounding_score
+from index_profiles import search_results
+from context_compression import COMPRESSION_RATIO, compress_chunks, format_compression
 
 # === Configuration ===
-OLLAMA_URL = "http://localhost:11434/api/generate"
+OLLAMA_URL = os.environ.get("OLLAMA_URL", "http://localhost:11434/api/generate")
 OLLAMA_MODEL = "llama2:7b"
-CHROMA_DB_DIR = "/home/sswarna/Documents/oran_docs/oran_rag_pipeline/chroma_index"
+CHROMA_DB_DIR = os.environ.get("CHROMA_DB_DIR", "/home/sswarna/Documents/oran_docs/oran_rag_pipeline/chroma_index")
 COLLECTION_NAME = "oran_docs"
-TOP_K = 50  # Limit retrieved chunks
+TOP_K = 50  # Limit retrieved chunks; vector search asks for the index profile's n_results (index_profiles.py)
+OLLAMA_KEEP_ALIVE = "30m"  # Keep llama2 loaded between queries
 
-# Load embedding model
+# Load embedding model at import so a preloading server shares it across forked workers
 EMBEDDING_MODEL_PATH = "/home/sswarna/models/all-MiniLM-L12-v2"
-embed_model = SentenceTransformer(EMBEDDING_MODEL_PATH)
+embed_model = load_embedder(EMBEDDING_MODEL_PATH)  # Same backend as ingestion (embedding_backend.py)
 
-# Initialize ChromaDB
-chroma_client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
-collection = chroma_client.get_collection(COLLECTION_NAME)
+# ChromaDB is opened lazily, once per worker process (its SQLite handles must not cross a fork).
+# Queries go to the active index version; a rebuild activated by step 4 is picked up without a restart.
+serving = serving_index(CHROMA_DB_DIR, COLLECTION_NAME)
+
+# Trigram index over document titles, written at ingestion and reloaded when an upload adds a title
+serving_titles = ServingTitleIndex(CHROMA_DB_DIR)
+
+def get_collections(shards=None):
+    """Return shard name -> collection of the active version, optionally restricted to `shards`.
+
+    Shards are re-listed on every call so ones created by an upload in another worker are seen.
+    """
+    if serving.version is None:
+        serving.refresh()
+    return open_shards(serving.client(), serving.version, shards=shards)
+
+# Shared, pooled Ollama client (one per worker process)
+ollama_client = OllamaClient(OLLAMA_URL, OLLAMA_MODEL, keep_alive=OLLAMA_KEEP_ALIVE)
+
+# Fixed RAG instructions, sent as Ollama's `system` prompt: they form an identical prefix on every
+# call, so Ollama reuses its evaluation instead of re-reading them before each retrieved context
+RAG_SYSTEM_PROMPT = """### Instructions for LLM:
+- **Only answer based on the retrieved context. if present**
+- **Do not mix Non-RT RIC and Near-RT RIC roles.**
+- **Exclude security considerations unless explicitly mentioned in the retrieved context.**
+"""
+
+def warm_up_llm():
+    """Load the model before the first query so it doesn't pay Ollama's model-load time."""
+    try:
+        print(f"DEBUG: {OLLAMA_MODEL} loaded in {ollama_client.warm_up():.1f}s (kept alive for {OLLAMA_KEEP_ALIVE})")
+    except Exception as e:
+        print(f"⚠️ Ollama warm-up failed, the first query will load the model: {e}")
 
 def embed_query(query):
     """Generate query embeddings to match stored embeddings."""
     return embed_model.encode(query).tolist()
 
-def extract_document_name(query):
-    """Extract document name if mentioned in query."""
-    if not isinstance(query, str) or not query.strip():
-        print(f"DEBUG: Invalid query type: {type(query)} or empty string")
-        return None
-    
-    match = re.search(r"(?:document|file)\s+([\w\.-]+)", query, re.IGNORECASE)
-    return match.group(1) if match else None
+def retrieve_relevant_chunks(query, shards=None):
+    """Retrieve relevant document chunks from the active index version."""
+    def search():
+        # Swaps to a newly activated version, or reloads after another worker's upload, once in-flight queries have finished
+        serving.refresh()
+        with serving.guard.reading():
+            return search_collections(get_collections(shards), query, restricted=bool(shards))
+    return serving.retrying(search)
 
-def retrieve_relevant_chunks(query):
-    """Retrieve relevant document chunks using metadata and vector search."""
-    doc_name = extract_document_name(query)
+def search_collections(collections, query, restricted=False):
+    """Retrieve relevant document chunks using metadata and vector search.
+
+    `restricted`: `collections` is a subset of the shards, so only titles stored in it are resolved.
+    """
     retrieved_chunks = []
 
-    # Get stored document titles
-    stored_titles = set(metadata.get("title", "Unknown") for metadata in collection.get(include=["metadatas"])['metadatas'])
-    
+    # Spec identifiers anywhere in the query, fuzzily resolved to a title stored in the searched shards
+    doc_name = serving_titles.get(serving.version, get_collections).resolve(
+        query, accept=stored_in(collections) if restricted else None
+    )
+
     # If document name is found, use exact metadata search
-    if doc_name and doc_name in stored_titles:
-        metadata_results = collection.get(
-            where={"title": doc_name},
-            include=["documents", "metadatas"]
-        )
-        
-        if metadata_results["documents"]:
-            retrieved_chunks.extend([
-                {
-                    "source": metadata_results["metadatas"][i].get("title", "Unknown"),
-                    "score": 1.0,
-                    "content": metadata_results["documents"][i]
-                }
-                for i in range(len(metadata_results["documents"]))
-            ])
+    if doc_name:
+        print(f"DEBUG: Resolved document title: {doc_name}")
+        for collection in collections.values():
+            metadata_results = collection.get(
+                where=content_filter(collection, {"title": doc_name}),
+                include=["documents", "metadatas", "embeddings"]  # Embeddings are reused for grounding
+            )
+            
+            if metadata_results["documents"]:
+                retrieved_chunks.extend([
+                    {
+                        "source": metadata_results["metadatas"][i].get("title", "Unknown"),
+                        "score": 1.0,
+                        "content": metadata_results["documents"][i],
+                        "embedding": metadata_results["embeddings"][i]
+                    }
+                    for i in range(len(metadata_results["documents"]))
+                ])
     
-    # Perform Vector Search
+    # Perform Vector Search, fanned out to every shard and merged by distance
     query_embedding = embed_query(query)
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=TOP_K,
-        include=["documents", "metadatas", "distances"]
-    )
+    hits, latencies = fan_out_query(collections, query_embedding, search_results(collections), where=content_filter, include_embeddings=True)
+    print(f"DEBUG: Shard latency: {format_latencies(latencies)}")
     
     retrieved_chunks.extend([
         {
-            "source": results["metadatas"][0][i].get("title", "Unknown"),
-            "score": results["distances"][0][i],
-            "content": results["documents"][0][i]
+            "source": hit["metadata"].get("title", "Unknown"),
+            "score": hit["distance"],
+            "content": hit["document"],
+            "embedding": hit["embedding"]
         }
-        for i in range(len(results["documents"][0]))
+        for hit in hits
     ])
     
     return retrieved_chunks[:TOP_K+2]
@@ -88,11 +129,11 @@ def generate_generic_llm(query):
     """
 
     try:
-        response = requests.post(OLLAMA_URL, json={"model": OLLAMA_MODEL, "prompt": llm_prompt, "stream": False})
-        if response.status_code == 200:
-            return response.json().get("response", "⚠️ No response from Ollama.")
-        else:
-            return f"❌ Error: {response.status_code}"
+        return ollama_client.generate(llm_prompt).get("response", "⚠️ No response from Ollama.")
+    except OllamaBusyError:
+        raise  # Surfaced by the app as a 503
+    except requests.HTTPError as e:
+        return f"❌ Error: {e.response.status_code}"
     except Exception as e:
         return f"❌ Ollama Request Failed: {e}"
 
@@ -102,11 +143,6 @@ def generate_dynamic_prompt_using_llm(query, retrieved_chunks):
     context = "\n".join([f"Source: {chunk['source']}\n{chunk['content']}" for chunk in retrieved_chunks])
 
     llm_prompt = f"""
-    ### Instructions for LLM:
-    - **Only answer based on the retrieved context. if present** 
-    - **Do not mix Non-RT RIC and Near-RT RIC roles.**
-    - **Exclude security considerations unless explicitly mentioned in the retrieved context.**
-
     ### Retrieved Context:
     {context}
 
@@ -118,18 +154,34 @@ def generate_dynamic_prompt_using_llm(query, retrieved_chunks):
     """
 
     try:
-        response = requests.post(OLLAMA_URL, json={"model": OLLAMA_MODEL, "prompt": llm_prompt, "stream": False})
-        if response.status_code == 200:
-            return response.json().get("response", "⚠️ No response from Ollama.")
-        else:
-            return f"❌ Error: {response.status_code}"
+        reply = ollama_client.generate(llm_prompt, system=RAG_SYSTEM_PROMPT)
+        print(f"DEBUG: LLM timing: {timing_summary(reply)}")
+        return reply.get("response", "⚠️ No response from Ollama.")
+    except OllamaBusyError:
+        raise  # Surfaced by the app as a 503
+    except requests.HTTPError as e:
+        return f"❌ Error: {e.response.status_code}"
     except Exception as e:
         return f"❌ Ollama Request Failed: {e}"
 
-def query_retrieval(user_query):
-    """Retrieves relevant document chunks and generates an LLM-based response."""
-    retrieved_chunks = retrieve_relevant_chunks(user_query)
+def score_answer(answer, context_chunks):
+    """Grounding of a RAG answer in the context it was given (chunk embeddings; only the answer is embedded)."""
+    if answer.startswith(("❌", "⚠️")):
+        return None  # Error text, not an answer
+    return grounding_score(embed_model, answer, [chunk["embedding"] for chunk in context_chunks])
+
+def query_retrieval(user_query, shards=None):
+    """Retrieves relevant document chunks and generates an LLM-based response.
+
+    Returns (RAG answer, generic answer, grounding of the RAG answer or None).
+    """
+    retrieved_chunks = retrieve_relevant_chunks(user_query, shards=shards)
+
+    # Only the sentences most relevant to the query go into the prompt
+    context_chunks, compression = compress_chunks(embed_model, user_query, retrieved_chunks, COMPRESSION_RATIO)
+    print(f"DEBUG: Context compression: {format_compression(compression)}")
 
-    structured_response = generate_dynamic_prompt_using_llm(user_query, retrieved_chunks)
+    structured_response = generate_dynamic_prompt_using_llm(user_query, context_chunks)
+    grounding = score_answer(structured_response, context_chunks)  # Against what the LLM saw, not the dropped sentences
     generic_response = generate_generic_llm(user_query)
-    return {structured_response, generic_response}
+    return structured_response, generic_response, grounding
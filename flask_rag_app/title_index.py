@@ -0,0 +1,224 @@
+import os
+import re
+import json
+import threading
+from collections import Counter
+
+from Levenshtein import ratio  # Install with: pip install python-Levenshtein
+
+# === Configuration ===
+TITLE_INDEX_SUFFIX = ".titles.json"  # Stored next to the index as <version>.titles.json
+TITLE_MATCH_THRESHOLD = 0.85  # Minimum Levenshtein ratio for a candidate to count as a match
+MAX_CANDIDATES = 10  # Best trigram candidates verified with Levenshtein
+# Spec identifiers anywhere in the query, e.g. "O-RAN.WG3.E2AP-v02.00", "WG1 architecture", "O-RAN WG4.CUS"
+SPEC_ID_PATTERN = re.compile(
+    r"(?i)(?<![\w.])((?:O-?RAN[.\s_-]?)?(?:WG\d{1,2}|SFG|TIFG|OSFG|SDFG|NGRG|TSTG)(?:[._-][\w-]+)*(?:\.\d+)*)"
+)
+DOCUMENT_PHRASE_PATTERN = re.compile(r"(?:document|file)\s+([\w\.-]+)", re.IGNORECASE)
+VERSION_SUFFIX_PATTERN = re.compile(r"(?i)[._\s-]*v?\d+(?:\.\d+)+$")
+VERSION_NUMBER_PATTERN = re.compile(r"(?i)v?(\d+(?:\.\d+)+)$")
+
+
+def normalize_title(title):
+    """Canonical form for matching: lower case, no "O-RAN" prefix or version, one kind of separator."""
+    title = title.lower().strip()
+    title = re.sub(r"^o-?ran[.\s_-]*", "", title)
+    title = VERSION_SUFFIX_PATTERN.sub("", title)
+    return re.sub(r"[.\s_-]+", ".", title).strip(".")
+
+
+def version_key(title):
+    """Numeric version of a title for ordering, e.g. "O-RAN.WG3.E2AP-v10.00" -> (10, 0); () if none."""
+    match = VERSION_NUMBER_PATTERN.search(title.strip())
+    return tuple(int(part) for part in match.group(1).split(".")) if match else ()
+
+
+def trigrams(text):
+    """Character trigrams of `text`, padded so short strings and word edges still produce some."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def extract_title_mentions(query):
+    """Spec identifiers anywhere in the query, plus anything named with "document X" / "file X"."""
+    if not isinstance(query, str) or not query.strip():
+        return []
+    mentions = [match.group(1) for match in SPEC_ID_PATTERN.finditer(query)]
+    mentions += DOCUMENT_PHRASE_PATTERN.findall(query)
+    return list(dict.fromkeys(mention.rstrip(".-_") for mention in mentions if mention.rstrip(".-_")))
+
+
+class TitleIndex:
+    """Character-trigram index over document titles, for fuzzy title lookup without scanning every title."""
+
+    def __init__(self, titles=()):
+        self.titles = []
+        self.sizes = []  # Trigram count per title, for the similarity denominator
+        self.postings = {}  # trigram -> ids of titles containing it
+        self._ids = {}
+        for title in titles:
+            self.add(title)
+
+    def __len__(self):
+        return len(self.titles)
+
+    def add(self, title):
+        """Index `title` (no-op if already present); returns True if it was new."""
+        if not title or title in self._ids:
+            return False
+        title_id = len(self.titles)
+        self._ids[title] = title_id
+        self.titles.append(title)
+        grams = trigrams(normalize_title(title))
+        self.sizes.append(len(grams))
+        for gram in grams:
+            self.postings.setdefault(gram, []).append(title_id)
+        return True
+
+    def candidates(self, text, limit=MAX_CANDIDATES):
+        """Titles sharing the most trigrams with `text`; only the postings of `text`'s trigrams are read."""
+        grams = trigrams(normalize_title(text))
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        scored = [(2 * count / (len(grams) + self.sizes[title_id]), self.titles[title_id])
+                  for title_id, count in shared.items()]
+        scored.sort(key=lambda item: (item[0], version_key(item[1])), reverse=True)
+        return [title for _, title in scored[:limit]]
+
+    def matches(self, text, threshold=TITLE_MATCH_THRESHOLD):
+        """Titles matching `text`, verified with Levenshtein, best first.
+
+        Titles are ranked on the versionless title. Among versions of the same spec, a mention with
+        a version ("WG3.E2AP-v02.00") prefers the closest full title, so the version named wins; a
+        mention without one ("WG3.E2AP") ties on every version and the latest version comes first.
+        """
+        if text in self._ids:
+            return [text]
+        wanted = normalize_title(text)
+        versioned = VERSION_SUFFIX_PATTERN.search(text) is not None
+        scored = []
+        for title in self.candidates(text):
+            score = ratio(wanted, normalize_title(title))
+            if score >= threshold:
+                version_score = ratio(text.lower(), title.lower()) if versioned else 0.0
+                scored.append((score, version_score, version_key(title), title))
+        scored.sort(reverse=True)
+        return [title for *_, title in scored]
+
+    def match(self, text, threshold=TITLE_MATCH_THRESHOLD):
+        """Best title for `text` (see matches), or None."""
+        found = self.matches(text, threshold)
+        return found[0] if found else None
+
+    def resolve(self, query, accept=None):
+        """The stored title a query refers to, from spec identifiers or "document X" phrasing, or None.
+
+        `accept` optionally rejects titles, e.g. ones not stored in the shards being searched.
+        """
+        for mention in extract_title_mentions(query):
+            for title in self.matches(mention):
+                if accept is None or accept(title):
+                    return title
+        return None
+
+    def to_dict(self):
+        return {"titles": self.titles, "sizes": self.sizes, "postings": self.postings}
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls()
+        index.titles = list(data["titles"])
+        index.sizes = list(data["sizes"])
+        index.postings = {gram: list(ids) for gram, ids in data["postings"].items()}
+        index._ids = {title: i for i, title in enumerate(index.titles)}
+        return index
+
+
+def title_index_path(chroma_db_dir, version):
+    return os.path.join(chroma_db_dir, f"{version}{TITLE_INDEX_SUFFIX}")
+
+
+def save_title_index(index, path):
+    """Write atomically (temp file + rename), so serving processes never read a partial index."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = os.path.join(os.path.dirname(path), f".tmp-{os.path.basename(path)}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index.to_dict(), f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def load_title_index(path):
+    """The saved index at `path`, or None if there isn't one."""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return TitleIndex.from_dict(json.load(f))
+    except (FileNotFoundError, json.JSONDecodeError, KeyError):
+        return None
+
+
+def build_title_index(collections):
+    """Index every title stored in `collections` (shard name -> collection); one full metadata scan."""
+    return TitleIndex(sorted({
+        metadata.get("title")
+        for collection in collections.values()
+        for metadata in collection.get(include=["metadatas"])["metadatas"]
+        if metadata.get("title")
+    }))
+
+
+def add_titles(chroma_db_dir, version, titles, collections=None):
+    """Add newly ingested titles to `version`'s saved index (callers serialize ingestion).
+
+    If `version` has no saved index yet (one built before title indexes existed), it is first
+    built from `collections`.
+    """
+    path = title_index_path(chroma_db_dir, version)
+    index = load_title_index(path)
+    if index is None:
+        index = build_title_index(collections) if collections else TitleIndex()
+        index_changed = True
+    else:
+        index_changed = False
+    for title in titles:
+        index_changed = index.add(title) or index_changed
+    if index_changed:
+        save_title_index(index, path)
+    return index
+
+
+class ServingTitleIndex:
+    """A serving process's view of the active version's title index, reloaded when an upload changes it."""
+
+    def __init__(self, chroma_db_dir):
+        self.chroma_db_dir = chroma_db_dir
+        self._lock = threading.Lock()
+        self._key = None
+        self.index = TitleIndex()
+
+    def get(self, version, open_collections):
+        """Index for `version`. If no index was written at ingestion, it is built from the collections
+        returned by `open_collections()` and saved; they are only opened then.
+        """
+        path = title_index_path(self.chroma_db_dir, version)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        with self._lock:
+            if (version, mtime) != self._key:
+                index = load_title_index(path) if mtime is not None else None
+                if index is None:
+                    index = build_title_index(open_collections())
+                    save_title_index(index, path)
+                    mtime = os.stat(path).st_mtime_ns
+                self.index = index
+                self._key = (version, mtime)
+            return self.index
+
+
+def stored_in(collections):
+    """Predicate for TitleIndex.resolve: is a title stored in any of `collections` (a subset of shards)?"""
+    def contains(title):
+        return any(collection.get(where={"title": title}, limit=1, include=[])["ids"] for collection in collections.values())
+    return contains
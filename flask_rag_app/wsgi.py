@@ -0,0 +1,8 @@
+import gc
+
+# Importing the app loads the embedding model once, in the master process
+from app import app  # noqa: F401
+
+# Move everything loaded so far out of the GC's reach so forked workers
+# don't dirty (and copy) the shared model pages when collecting
+gc.freeze()
@@ -0,0 +1,184 @@
+import os
+import json
+import time
+import argparse
+import numpy as np
+
+# === Configuration ===
+EMBEDDING_BACKEND = "torch"  # "torch" (SentenceTransformer), "onnx" (ONNX Runtime fp32) or "onnx-int8" (dynamic int8)
+ONNX_EXPORT_DIR = "/home/sswarna/models/all-MiniLM-L12-v2-onnx"
+ONNX_OPSET = 14
+DEFAULT_MAX_SEQ_LENGTH = 128  # all-MiniLM-L12-v2's sentence-transformers default
+PARITY_MIN_COSINE = {"onnx": 0.999, "onnx-int8": 0.98}  # Worst-case cosine vs. the PyTorch path
+
+
+def _tmp_path(path):
+    """Per-process temporary name next to `path` (same .onnx extension, which the exporters expect)."""
+    return os.path.join(os.path.dirname(path), f".tmp-{os.getpid()}-{os.path.basename(path)}")
+
+
+def export_onnx(model_path, export_dir=ONNX_EXPORT_DIR, quantize=False):
+    """Export the transformer to ONNX once (and quantize it to int8 once); return the model file to load.
+
+    Each file is written under a temporary name and renamed into place, so an interrupted export is
+    never mistaken for a finished one. Call it once before starting worker processes.
+    """
+    fp32_path = os.path.join(export_dir, "model.onnx")
+    int8_path = os.path.join(export_dir, "model-int8.onnx")
+    os.makedirs(export_dir, exist_ok=True)
+
+    if not os.path.exists(fp32_path):
+        import torch
+        from transformers import AutoModel, AutoTokenizer
+
+        print(f"📦 Exporting {model_path} to ONNX: {fp32_path}")
+        tokenizer = AutoTokenizer.from_pretrained(model_path)
+        transformer = AutoModel.from_pretrained(model_path).eval()
+
+        class TokenEmbeddings(torch.nn.Module):
+            """Expose only last_hidden_state so the graph has a single, named output."""
+
+            def __init__(self, model):
+                super().__init__()
+                self.model = model
+
+            def forward(self, input_ids, attention_mask, token_type_ids):
+                return self.model(input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids)[0]
+
+        dummy = tokenizer(["O-RAN Near-RT RIC"], return_tensors="pt")
+        dynamic = {0: "batch", 1: "sequence"}
+        tmp_path = _tmp_path(fp32_path)
+        torch.onnx.export(
+            TokenEmbeddings(transformer),
+            (dummy["input_ids"], dummy["attention_mask"], dummy["token_type_ids"]),
+            tmp_path,
+            input_names=["input_ids", "attention_mask", "token_type_ids"],
+            output_names=["token_embeddings"],
+            dynamic_axes={"input_ids": dynamic, "attention_mask": dynamic, "token_type_ids": dynamic, "token_embeddings": dynamic},
+            opset_version=ONNX_OPSET,
+        )
+        os.replace(tmp_path, fp32_path)
+
+    if not quantize:
+        return fp32_path
+
+    if not os.path.exists(int8_path):
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+
+        print(f"📦 Quantizing to dynamic int8: {int8_path}")
+        tmp_path = _tmp_path(int8_path)
+        quantize_dynamic(fp32_path, tmp_path, weight_type=QuantType.QInt8)
+        os.replace(tmp_path, int8_path)
+    return int8_path
+
+
+class OnnxEmbedder:
+    """ONNX Runtime stand-in for SentenceTransformer.encode: mean pooling, then L2 normalization."""
+
+    def __init__(self, model_path, quantize=False, export_dir=ONNX_EXPORT_DIR, num_threads=0):
+        from transformers import AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_path)
+        self.onnx_path = export_onnx(model_path, export_dir, quantize)
+        self.num_threads = num_threads  # 0 lets ONNX Runtime pick; set per worker before first use
+        self.max_seq_length = DEFAULT_MAX_SEQ_LENGTH
+        config_path = os.path.join(model_path, "sentence_bert_config.json")
+        if os.path.exists(config_path):
+            with open(config_path, "r", encoding="utf-8") as f:
+                self.max_seq_length = json.load(f).get("max_seq_length", DEFAULT_MAX_SEQ_LENGTH)
+        self.normalize = os.path.isdir(os.path.join(model_path, "2_Normalize"))
+        self._session = None
+        self._pid = None
+
+    @property
+    def session(self):
+        """Inference session for the current process; ONNX Runtime's thread pools don't survive a fork."""
+        if self._session is None or self._pid != os.getpid():
+            import onnxruntime as ort
+
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            options.intra_op_num_threads = self.num_threads
+            self._session = ort.InferenceSession(self.onnx_path, options, providers=["CPUExecutionProvider"])
+            self._input_names = {node.name for node in self._session.get_inputs()}
+            self._pid = os.getpid()
+        return self._session
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        """Embed a string (returns a 1-D array) or a list of strings (returns a 2-D array)."""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        session = self.session
+        vectors = []
+        for start in range(0, len(texts), batch_size):
+            features = self.tokenizer(texts[start:start + batch_size], padding=True, truncation=True,
+                                      max_length=self.max_seq_length, return_tensors="np")
+            feed = {name: features[name].astype(np.int64) for name in self._input_names if name in features}
+            token_embeddings = session.run(None, feed)[0]
+            mask = features["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            if self.normalize:
+                pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            vectors.append(pooled)
+        embeddings = np.vstack(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+        return embeddings[0] if single else embeddings
+
+
+def load_embedder(model_path, backend=EMBEDDING_BACKEND):
+    """Embedding model for `backend`; every backend exposes the same encode() interface."""
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(model_path)
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEmbedder(model_path, quantize=backend == "onnx-int8")
+    raise ValueError(f"Unknown embedding backend: {backend}")
+
+
+def compare_backends(model_path, backend, sentences, batch_size=32, repeats=3):
+    """Parity (cosine vs. PyTorch) and throughput (sentences/sec) of `backend` against the PyTorch path."""
+    reference = load_embedder(model_path, "torch")
+    candidate = load_embedder(model_path, backend)
+
+    def throughput(model):
+        model.encode(sentences[:batch_size], batch_size=batch_size)  # Warm-up
+        start = time.perf_counter()
+        for _ in range(repeats):
+            embeddings = model.encode(sentences, batch_size=batch_size)
+        return np.asarray(embeddings, dtype=np.float32), len(sentences) * repeats / (time.perf_counter() - start)
+
+    torch_vectors, torch_rate = throughput(reference)
+    candidate_vectors, candidate_rate = throughput(candidate)
+
+    torch_vectors /= np.linalg.norm(torch_vectors, axis=1, keepdims=True)
+    candidate_vectors /= np.linalg.norm(candidate_vectors, axis=1, keepdims=True)
+    cosines = (torch_vectors * candidate_vectors).sum(axis=1)
+
+    threshold = PARITY_MIN_COSINE[backend]
+    status = "✅" if cosines.min() >= threshold else "❌"
+    print(f"{status} Parity {backend} vs torch: min cosine {cosines.min():.5f}, mean {cosines.mean():.5f} "
+          f"(threshold {threshold}) over {len(sentences)} sentences")
+    print(f"⚡ Throughput: torch {torch_rate:.1f}/s, {backend} {candidate_rate:.1f}/s ({candidate_rate / torch_rate:.2f}x)")
+    return cosines.min() >= threshold
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the embedder to ONNX and check it against PyTorch.")
+    parser.add_argument("--model", default="/home/sswarna/models/all-MiniLM-L12-v2", help="Local sentence-transformers model")
+    parser.add_argument("--backend", default="onnx-int8", choices=["onnx", "onnx-int8"])
+    parser.add_argument("--sentences", help="Text file with one sample sentence per line (defaults to built-in O-RAN samples)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    args = parser.parse_args()
+
+    if args.sentences:
+        with open(args.sentences, "r", encoding="utf-8") as f:
+            samples = [line.strip() for line in f if line.strip()]
+    else:
+        samples = [
+            "The Near-RT RIC hosts xApps that control RAN functions over the E2 interface.",
+            "The Non-RT RIC provides policy-based guidance to the Near-RT RIC over the A1 interface.",
+            "O-RAN security includes authentication, encryption and access control.",
+            "The O-DU terminates the fronthaul interface towards the O-RU.",
+            "E2 Setup is initiated by the E2 Node to establish the E2 connection.",
+            "The SMO performs FCAPS management through the O1 interface.",
+        ] * 32
+    raise SystemExit(0 if compare_backends(args.model, args.backend, samples, args.batch_size) else 1)
@@ -0,0 +1,146 @@
+import os
+import math
+import time
+import argparse
+import multiprocessing
+import numpy as np
+
+from embedding_backend import EMBEDDING_BACKEND, load_embedder, export_onnx
+from chunk_io import find_artifacts, read_artifact
+
+# === Configuration ===
+POOL_START_METHOD = "spawn"  # Fresh interpreters: torch and ONNX Runtime thread pools don't survive a fork
+PIN_CPU_AFFINITY = True  # Linux: also pin each worker to its own cores, so workers don't compete for them
+SCALING_SAMPLE_SIZE = 4096  # Chunks embedded per worker count in the scaling report
+
+# The model inside each pool worker
+_worker_model = None
+
+
+def _init_worker(model_path, backend, threads, cpu_sets, counter):
+    """Runs once in each worker: pin threads (and cores), then load the embedder."""
+    global _worker_model
+    with counter.get_lock():
+        index = counter.value
+        counter.value += 1
+    if cpu_sets:
+        os.sched_setaffinity(0, cpu_sets[index % len(cpu_sets)])
+    for variable in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[variable] = str(threads)
+
+    _worker_model = load_embedder(model_path, backend)
+    if hasattr(_worker_model, "num_threads"):  # ONNX backend: read when its session is created
+        _worker_model.num_threads = threads
+    else:
+        import torch
+        torch.set_num_threads(threads)
+
+
+def _encode_shard(args):
+    texts, batch_size = args
+    return np.asarray(_worker_model.encode(texts, batch_size=batch_size), dtype=np.float32)
+
+
+class EmbeddingPool:
+    """Process pool with the same encode() interface as the in-process embedders.
+
+    Like sentence-transformers' encode_multi_process, each call is split into one contiguous shard
+    per worker and the results are concatenated in input order. Unlike it, every worker gets a fixed
+    thread count (and, on Linux, its own cores) and any embedding_backend backend can be used.
+    """
+
+    def __init__(self, model_path, workers, backend=EMBEDDING_BACKEND, threads_per_worker=None):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+
+        cpu_sets = None
+        if PIN_CPU_AFFINITY and hasattr(os, "sched_getaffinity"):
+            cores = sorted(os.sched_getaffinity(0))
+            if len(cores) >= workers * self.threads_per_worker:
+                t = self.threads_per_worker
+                cpu_sets = [set(cores[i * t:(i + 1) * t]) for i in range(workers)]
+
+        if backend in ("onnx", "onnx-int8"):
+            export_onnx(model_path, quantize=backend == "onnx-int8")  # Once, here: not raced by every worker
+
+        context = multiprocessing.get_context(POOL_START_METHOD)
+        self._pool = context.Pool(
+            workers,
+            initializer=_init_worker,
+            initargs=(model_path, backend, self.threads_per_worker, cpu_sets, context.Value("i", 0)),
+        )
+        print(f"🧵 Embedding pool: {workers} workers × {self.threads_per_worker} threads"
+              f"{' (cores pinned)' if cpu_sets else ''}")
+
+    def encode(self, sentences, batch_size=32, **kwargs):
+        """Embed a string (returns a 1-D array) or a list of strings (returns a 2-D array, in input order)."""
+        single = isinstance(sentences, str)
+        texts = [sentences] if single else list(sentences)
+        if not texts:
+            return np.zeros((0, 0), dtype=np.float32)
+        shard_size = math.ceil(len(texts) / self.workers)
+        shards = [(texts[start:start + shard_size], batch_size) for start in range(0, len(texts), shard_size)]
+        embeddings = np.vstack(self._pool.map(_encode_shard, shards))  # map() returns results in shard order
+        return embeddings[0] if single else embeddings
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+
+def scaling_report(model_path, texts, max_workers, backend=EMBEDDING_BACKEND, threads_per_worker=1, batch_size=64):
+    """Throughput from 1 to `max_workers` workers at a fixed thread count each; prints a Markdown table."""
+    worker_counts = sorted({1, *(2 ** i for i in range(1, max_workers.bit_length())), max_workers})
+    results = []
+    for workers in worker_counts:
+        with EmbeddingPool(model_path, workers, backend, threads_per_worker) as pool:
+            pool.encode(texts[:workers * batch_size], batch_size=batch_size)  # Load the model in every worker
+            start = time.perf_counter()
+            pool.encode(texts, batch_size=batch_size)
+            rate = len(texts) / (time.perf_counter() - start)
+        results.append((workers, rate))
+        print(f"✅ {workers} worker(s): {rate:.1f} chunks/sec")
+
+    baseline = results[0][1]
+    print("\n| Workers | Threads/worker | chunks/sec | Speed-up | Efficiency |")
+    print("|---|---|---|---|---|")
+    for workers, rate in results:
+        print(f"| {workers} | {threads_per_worker} | {rate:.1f} | {rate / baseline:.2f}x | {rate / (baseline * workers):.0%} |")
+    return results
+
+
+def sample_chunk_texts(chunks_dir, limit=SCALING_SAMPLE_SIZE):
+    """Up to `limit` chunk texts from the chunk artifacts under `chunks_dir`."""
+    texts = []
+    for root, _, _ in os.walk(chunks_dir):
+        for path in find_artifacts(root, "chunks"):
+            _, records = read_artifact(path)
+            for record in records:
+                if record.get("chunk_content"):
+                    texts.append(record["chunk_content"])
+                    if len(texts) >= limit:
+                        return texts
+    return texts
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Report embedding throughput and scaling efficiency from 1 to N worker processes.")
+    parser.add_argument("--model", default="/home/sswarna/models/all-MiniLM-L12-v2", help="Local sentence-transformers model")
+    parser.add_argument("--backend", default=EMBEDDING_BACKEND, choices=["torch", "onnx", "onnx-int8"])
+    parser.add_argument("--chunks", default="/home/sswarna/Documents/oran_docs/output_all/Step2_chunks", help="Chunk artifacts to sample texts from")
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--threads-per-worker", type=int, default=1)
+    parser.add_argument("--batch-size", type=int, default=64)
+    args = parser.parse_args()
+
+    sample = sample_chunk_texts(args.chunks)
+    if not sample:
+        raise SystemExit(f"No chunk artifacts found under {args.chunks}")
+    scaling_report(args.model, sample, args.max_workers, args.backend, args.threads_per_worker, args.batch_size)
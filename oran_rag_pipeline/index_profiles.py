@@ -0,0 +1,67 @@
+from sharding import SHARD_SEPARATOR
+from index_versions import version_collections
+
+# === Configuration ===
+INDEX_PROFILE = "balanced"  # Profile for newly created collections; pick one with index_tuning.py
+
+# HNSW build parameters (fixed when a collection is created) and search-time settings per profile.
+# Embeddings are L2-normalized, so "cosine" ranks like Chroma's default "l2" but reports 0-2 distances.
+INDEX_PROFILES = {
+    "fast": {"space": "cosine", "M": 8, "construction_ef": 64, "search_ef": 32, "n_results": 20},
+    "balanced": {"space": "cosine", "M": 16, "construction_ef": 128, "search_ef": 64, "n_results": 50},
+    "high-recall": {"space": "cosine", "M": 32, "construction_ef": 256, "search_ef": 256, "n_results": 50},
+}
+
+
+def get_profile(name=INDEX_PROFILE):
+    if name not in INDEX_PROFILES:
+        raise ValueError(f"Unknown index profile: {name} (choose from {', '.join(INDEX_PROFILES)})")
+    return INDEX_PROFILES[name]
+
+
+def collection_metadata(profile, name=None):
+    """Chroma collection metadata for `profile`; `name` is recorded so serving can look the profile up."""
+    metadata = {
+        "hnsw:space": profile["space"],
+        "hnsw:M": profile["M"],
+        "hnsw:construction_ef": profile["construction_ef"],
+        "hnsw:search_ef": profile["search_ef"],
+    }
+    if name:
+        metadata["index_profile"] = name
+    return metadata
+
+
+def version_space(chroma_client, collection_name):
+    """Distance space of the collections already in `collection_name`'s version, or None if there are none."""
+    version = collection_name.split(SHARD_SEPARATOR, 1)[0]
+    for name in version_collections(chroma_client, version):
+        return (chroma_client.get_collection(name).metadata or {}).get("hnsw:space", "l2")  # Chroma's default
+    return None
+
+
+def get_or_create_profiled_collection(chroma_client, collection_name, profile_name=INDEX_PROFILE):
+    """Open `collection_name`, creating it with `profile_name`'s HNSW parameters if it doesn't exist.
+
+    An existing collection keeps the parameters it was built with; rebuild (step 4) to change them.
+    A new shard of a version that already has shards takes their distance space: step 5 merges
+    shards by raw distance, and l2 and cosine distances are not on the same scale.
+    """
+    try:
+        return chroma_client.get_collection(collection_name)
+    except Exception:
+        profile = dict(get_profile(profile_name))
+        space = version_space(chroma_client, collection_name)
+        if space and space != profile["space"]:
+            print(f"⚠️ {collection_name}: using the version's existing '{space}' space, not '{profile['space']}'")
+            profile["space"] = space
+        return chroma_client.create_collection(name=collection_name, metadata=collection_metadata(profile, profile_name))
+
+
+def search_results(collections, default=INDEX_PROFILE):
+    """Neighbours to request per query, from the profile the collections were built with."""
+    names = {(collection.metadata or {}).get("index_profile") for collection in collections.values()}
+    names.discard(None)
+    # Collections built before profiles existed, or with mixed profiles, fall back to the default
+    profile_name = names.pop() if len(names) == 1 else default
+    return get_profile(profile_name)["n_results"]
@@ -0,0 +1,156 @@
+import os
+import json
+import time
+import random
+import argparse
+import itertools
+import numpy as np
+import chromadb
+
+from index_versions import active_version
+from index_profiles import INDEX_PROFILES, collection_metadata
+from sharding import open_shards, content_filter
+
+# === Configuration ===
+CHROMA_DB_DIR = "/home/sswarna/Documents/oran_docs/oran_rag_pipeline/chroma_index"
+COLLECTION_NAME = "oran_docs"
+TUNING_OUTPUT_PATH = "/home/sswarna/Documents/oran_docs/output_all/index_tuning_results.json"
+TARGET_RECALL = 0.95  # Recall@k against exact search that a profile must reach
+CORPUS_SAMPLE = 20000  # Stored content embeddings sampled at random across shards as the tuning corpus
+QUERY_SAMPLE = 200  # Held-out embeddings used as queries (removed from the corpus)
+SWEEP_GRID = {"M": [8, 16, 32], "construction_ef": [64, 128, 256], "search_ef": [16, 32, 64, 128, 256]}
+ADD_BATCH_SIZE = 5000
+TIE_EPSILON = 1e-6  # A hit this close to the k-th exact distance counts as correct (duplicate chunks tie)
+
+
+def load_corpus(chroma_client, version, limit=CORPUS_SAMPLE, seed=0):
+    """Up to `limit` content embeddings of `version`, sampled at random across all its shards.
+
+    Boilerplate is left out because serving filters it out of every search.
+    """
+    ids_by_shard = {}
+    for collection in open_shards(chroma_client, version).values():
+        ids_by_shard[collection.name] = (collection, collection.get(where=content_filter(collection), include=[])["ids"])
+    population = [(name, row_id) for name, (_, ids) in ids_by_shard.items() for row_id in ids]
+    sample = random.Random(seed).sample(population, min(limit, len(population)))
+
+    vectors = []
+    for name, (collection, _) in ids_by_shard.items():
+        wanted = [row_id for shard, row_id in sample if shard == name]
+        for offset in range(0, len(wanted), ADD_BATCH_SIZE):
+            vectors.extend(collection.get(ids=wanted[offset:offset + ADD_BATCH_SIZE], include=["embeddings"])["embeddings"])
+    return np.asarray(vectors, dtype=np.float32)
+
+
+def exact_distances(corpus, queries, space):
+    """Brute-force distance from every query to every corpus row (smaller is closer)."""
+    if space == "cosine":
+        normed = corpus / np.clip(np.linalg.norm(corpus, axis=1, keepdims=True), 1e-12, None)
+        return 1 - (queries / np.clip(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12, None)) @ normed.T
+    if space == "ip":
+        return 1 - queries @ corpus.T
+    return (queries ** 2).sum(axis=1)[:, None] - 2 * queries @ corpus.T + (corpus ** 2).sum(axis=1)[None, :]  # l2
+
+
+def evaluate(corpus, queries, distances, params, k):
+    """Build an in-memory Chroma index with `params`; return recall@k, query latency and build time.
+
+    A returned row counts as a true neighbour if it is no farther than the k-th exact neighbour,
+    so rows tied with it (duplicate chunks) are not scored as misses.
+    """
+    kth = np.partition(distances, k - 1, axis=1)[:, k - 1]
+    client = chromadb.EphemeralClient()
+    name = f"tuning_{os.getpid()}_{time.time_ns()}"
+    collection = client.create_collection(name=name, metadata=collection_metadata(params))
+    try:
+        start = time.perf_counter()
+        for offset in range(0, len(corpus), ADD_BATCH_SIZE):
+            batch = corpus[offset:offset + ADD_BATCH_SIZE]
+            collection.add(ids=[str(i) for i in range(offset, offset + len(batch))], embeddings=batch.tolist())
+        build_seconds = time.perf_counter() - start
+
+        latencies, recalls = [], []
+        for i, query in enumerate(queries):
+            start = time.perf_counter()
+            result = collection.query(query_embeddings=[query.tolist()], n_results=k, include=[])
+            latencies.append(time.perf_counter() - start)
+            found = [int(row_id) for row_id in result["ids"][0]]
+            recalls.append(int((distances[i, found] <= kth[i] + TIE_EPSILON).sum()) / k)
+    finally:
+        client.delete_collection(name)
+
+    latencies.sort()
+    return {
+        "recall": round(float(np.mean(recalls)), 4),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95)] * 1000, 3),
+        "build_s": round(build_seconds, 2),
+    }
+
+
+def tune(target_recall=TARGET_RECALL, k=50, sweep=False, space="cosine"):
+    """Score the named profiles (and optionally the SWEEP_GRID) and pick the fastest that meets `target_recall`.
+
+    Each named profile is scored at its own n_results, the k step 5 serves with it; sweep points use `k`.
+    """
+    candidates = [(name, profile, profile["n_results"]) for name, profile in INDEX_PROFILES.items()]
+    if sweep:
+        for M, construction_ef, search_ef in itertools.product(*SWEEP_GRID.values()):
+            params = {"space": space, "M": M, "construction_ef": construction_ef, "search_ef": search_ef}
+            candidates.append((f"M={M},cef={construction_ef},ef={search_ef}", params, k))
+
+    client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
+    vectors = load_corpus(client, active_version(CHROMA_DB_DIR, COLLECTION_NAME))
+    max_k = max(candidate_k for _, _, candidate_k in candidates)
+    if len(vectors) < QUERY_SAMPLE + max_k:
+        raise SystemExit(f"Only {len(vectors)} stored content embeddings; build the index (steps 1–4) first.")
+
+    rng = random.Random(0)
+    query_rows = set(rng.sample(range(len(vectors)), QUERY_SAMPLE))
+    queries = vectors[sorted(query_rows)]
+    corpus = vectors[[i for i in range(len(vectors)) if i not in query_rows]]
+    print(f"📐 Tuning on {len(corpus)} sampled content embeddings, {len(queries)} held-out queries, recall@k target {target_recall}")
+
+    distances_by_space = {}
+    results = []
+    for name, params, candidate_k in candidates:
+        if params["space"] not in distances_by_space:
+            distances_by_space[params["space"]] = exact_distances(corpus, queries, params["space"])
+        scores = evaluate(corpus, queries, distances_by_space[params["space"]], params, candidate_k)
+        results.append({"name": name, **{field: params[field] for field in ("space", "M", "construction_ef", "search_ef")},
+                        "k": candidate_k, **scores})
+        print(f"  {name}: recall@{candidate_k} {scores['recall']:.3f}, p50 {scores['p50_ms']:.2f}ms, p95 {scores['p95_ms']:.2f}ms, build {scores['build_s']:.1f}s")
+
+    print("\n| Candidate | M | construction_ef | search_ef | k | Recall@k | p50 (ms) | p95 (ms) | Build (s) |")
+    print("|---|---|---|---|---|---|---|---|---|")
+    for r in sorted(results, key=lambda r: r["p50_ms"]):
+        flag = "✅" if r["recall"] >= target_recall else "❌"
+        print(f"| {flag} {r['name']} | {r['M']} | {r['construction_ef']} | {r['search_ef']} | {r['k']} | {r['recall']:.3f} "
+              f"| {r['p50_ms']:.2f} | {r['p95_ms']:.2f} | {r['build_s']:.1f} |")
+
+    passing = [r for r in results if r["recall"] >= target_recall]
+    best_profile = min((r for r in passing if r["name"] in INDEX_PROFILES), key=lambda r: r["p50_ms"], default=None)
+    best_overall = min(passing, key=lambda r: r["p50_ms"], default=None)
+    if best_profile:
+        print(f"\n🏁 Fastest profile meeting recall {target_recall}: {best_profile['name']} "
+              f"(set INDEX_PROFILE = \"{best_profile['name']}\" and rebuild with step 4)")
+    else:
+        print(f"\n⚠️ No named profile reaches recall {target_recall}; raise search_ef/M in INDEX_PROFILES")
+    if best_overall and best_overall is not best_profile:
+        print(f"💡 Fastest sweep point meeting the target: {best_overall['name']}")
+
+    os.makedirs(os.path.dirname(TUNING_OUTPUT_PATH), exist_ok=True)
+    with open(TUNING_OUTPUT_PATH, "w", encoding="utf-8") as f:
+        json.dump({"target_recall": target_recall, "sweep_k": k, "corpus": len(corpus), "queries": len(queries),
+                   "chosen": best_profile["name"] if best_profile else None, "results": results}, f, indent=4)
+    print(f"📊 Results saved to {TUNING_OUTPUT_PATH}")
+    return best_profile
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep HNSW parameters against exact search and pick an index profile.")
+    parser.add_argument("--target-recall", type=float, default=TARGET_RECALL)
+    parser.add_argument("--k", type=int, default=50, help="Neighbours per query for sweep points (named profiles use their own n_results)")
+    parser.add_argument("--sweep", action="store_true", help="Also evaluate every point of SWEEP_GRID")
+    args = parser.parse_args()
+    tune(args.target_recall, args.k, args.sweep)
@@ -0,0 +1,346 @@
+import os
+import json
+import fcntl
+import time
+import random
+import threading
+from contextlib import contextmanager
+
+from sharding import SHARD_SEPARATOR, list_shards, shard_collection_name
+
+# === Configuration ===
+ACTIVE_INDEX_FILE = "active_index.json"  # Pointer file inside CHROMA_DB_DIR naming the serving version
+INGEST_LOCK_FILE = ".ingest.lock"  # Lock file inside CHROMA_DB_DIR serializing writers (uploads, daemon, swaps)
+WRITE_GENERATION_FILE = ".write_generation"  # Rewritten on every ingest_lock release; processes reload their client when it changes
+STALE_INDEX_ERRORS = ("Error finding id",)  # Chroma's error when rows another process wrote are missing from the loaded index
+VERSION_SEPARATOR = "_v"  # Versions are named <base>_v<timestamp>, e.g. oran_docs_v20240611-142501
+KEEP_PREVIOUS_VERSIONS = 1  # Older versions kept for rollback; the rest are garbage-collected
+MIN_COUNT_RATIO = 0.9  # A new version must hold at least this share of the active version's rows
+VALIDATION_SAMPLES = 200  # Rows per collection whose own embedding must retrieve them
+VALIDATION_NEIGHBOURS = 5  # A sampled row passes if it is among this many nearest neighbours...
+DUPLICATE_DISTANCE = 1e-6  # ...or the nearest hit is this close (an identical boilerplate chunk won the tie)
+MAX_MISS_RATE = 0.01  # HNSW search is approximate: tolerate this share of sampled rows failing
+
+
+def new_version_name(base_name):
+    """Fresh version name for a rebuild of `base_name`."""
+    return f"{base_name}{VERSION_SEPARATOR}{time.strftime('%Y%m%d-%H%M%S')}"
+
+
+def _pointer_path(chroma_db_dir):
+    return os.path.join(chroma_db_dir, ACTIVE_INDEX_FILE)
+
+
+def read_pointer(chroma_db_dir):
+    """The pointer file's contents, or None before the first versioned build."""
+    try:
+        with open(_pointer_path(chroma_db_dir), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def active_version(chroma_db_dir, base_name):
+    """Name of the version currently serving; the unversioned `base_name` for legacy indexes."""
+    pointer = read_pointer(chroma_db_dir)
+    return pointer["active"] if pointer else base_name
+
+
+def _write_generation_path(chroma_db_dir):
+    return os.path.join(chroma_db_dir, WRITE_GENERATION_FILE)
+
+
+def read_write_generation(chroma_db_dir):
+    """Token of the last write to the store ("<pid>:<time_ns>"), or None before the first one."""
+    try:
+        with open(_write_generation_path(chroma_db_dir), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def _bump_write_generation(chroma_db_dir):
+    path = _write_generation_path(chroma_db_dir)
+    tmp_path = f"{path}.tmp"  # Only written under the ingest lock, so the name can't collide
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(f"{os.getpid()}:{time.time_ns()}")
+    os.replace(tmp_path, path)
+
+
+@contextmanager
+def ingest_lock(chroma_db_dir):
+    """Hold an exclusive, cross-process lock on writes to the store in `chroma_db_dir`.
+
+    Taken by Flask uploads, the ingest daemon and step 4's catch-up and swap, so that no write can
+    land in a version between its catch-up pass and the switch to its successor. On release the
+    write generation is bumped: each process keeps its own in-memory copy of the HNSW index, and
+    that copy never sees rows another process wrote until the client is reopened.
+    """
+    os.makedirs(chroma_db_dir, exist_ok=True)
+    with open(os.path.join(chroma_db_dir, INGEST_LOCK_FILE), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            _bump_write_generation(chroma_db_dir)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def is_stale_index_error(error):
+    """Whether a Chroma error means this process's loaded index misses another process's writes."""
+    return any(marker in str(error) for marker in STALE_INDEX_ERRORS)
+
+
+def activate(chroma_db_dir, version, previous_version=None):
+    """Atomically point serving at `version` (write a temp file, then rename over the pointer).
+
+    `previous_version` joins the rollback history even when it is a legacy, unversioned collection.
+    """
+    pointer = read_pointer(chroma_db_dir) or {"active": None, "history": []}
+    previous_version = pointer.get("active") or previous_version
+    history = [v for v in pointer.get("history", []) if v != version]
+    if previous_version and previous_version != version:
+        history.insert(0, previous_version)
+    new_pointer = {"active": version, "history": history, "activated_at": time.strftime("%Y-%m-%d %H:%M:%S")}
+
+    os.makedirs(chroma_db_dir, exist_ok=True)
+    tmp_path = _pointer_path(chroma_db_dir) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(new_pointer, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, _pointer_path(chroma_db_dir))
+    print(f"🔀 Active index is now {version}")
+
+
+def version_collections(chroma_client, version):
+    """Every collection belonging to `version`: the unsharded one and/or its shards."""
+    names = {getattr(c, "name", c) for c in chroma_client.list_collections()}
+    collections = [version] if version in names else []
+    collections += [shard_collection_name(version, shard) for shard in list_shards(chroma_client, version)]
+    return collections
+
+
+def count_rows(chroma_client, version):
+    return sum(chroma_client.get_collection(name).count() for name in version_collections(chroma_client, version))
+
+
+def validate_version(chroma_client, version, previous_version=None):
+    """Check a freshly built version before it is activated; returns (ok, message)."""
+    names = version_collections(chroma_client, version)
+    if not names:
+        return False, f"{version} has no collections"
+
+    total = count_rows(chroma_client, version)
+    if total == 0:
+        return False, f"{version} is empty"
+    if previous_version and version_collections(chroma_client, previous_version):
+        previous_total = count_rows(chroma_client, previous_version)
+        if total < previous_total * MIN_COUNT_RATIO:
+            return False, f"{version} has {total} rows, fewer than {MIN_COUNT_RATIO:.0%} of {previous_version}'s {previous_total}"
+
+    # Self-retrieval: a stored row's own embedding must come back among its nearest neighbours
+    sampled = misses = 0
+    for name in names:
+        collection = chroma_client.get_collection(name)
+        count = collection.count()
+        if count == 0:
+            return False, f"{name} is empty"
+        offset = random.randint(0, max(count - VALIDATION_SAMPLES, 0))
+        sample = collection.get(limit=VALIDATION_SAMPLES, offset=offset, include=["embeddings"])
+        results = collection.query(query_embeddings=list(sample["embeddings"]),
+                                   n_results=min(VALIDATION_NEIGHBOURS, count), include=["distances"])
+        for row_id, hit_ids, distances in zip(sample["ids"], results["ids"], results["distances"]):
+            if row_id not in hit_ids and not (distances and distances[0] <= DUPLICATE_DISTANCE):
+                misses += 1
+        sampled += len(sample["ids"])
+    if misses > sampled * MAX_MISS_RATE:
+        return False, f"{version}: {misses}/{sampled} sampled rows do not retrieve themselves (max {MAX_MISS_RATE:.0%})"
+
+    return True, f"{version}: {total} rows in {len(names)} collection(s), {misses}/{sampled} self-retrieval misses"
+
+
+def garbage_collect(chroma_client, chroma_db_dir, base_name, keep=KEEP_PREVIOUS_VERSIONS):
+    """Drop every version of `base_name` except the active one and the `keep` most recent before it.
+
+    Versions newer than the active one are builds still in progress (another step 4 run) and are kept.
+    """
+    pointer = read_pointer(chroma_db_dir)
+    if not pointer:
+        return []
+    active = pointer["active"]
+    kept = {active, *pointer.get("history", [])[:keep]}
+
+    prefix = f"{base_name}{VERSION_SEPARATOR}"
+    dropped = []
+    for name in (getattr(c, "name", c) for c in chroma_client.list_collections()):
+        version = name.split(SHARD_SEPARATOR, 1)[0]
+        if version.startswith(prefix) and active.startswith(prefix) and version > active:
+            continue  # Timestamped names sort chronologically
+        if (version.startswith(prefix) or version == base_name) and version not in kept:
+            chroma_client.delete_collection(name)
+            dropped.append(name)
+    if dropped:
+        print(f"🗑️ Garbage-collected {len(dropped)} collection(s) from old index versions")
+    return dropped
+
+
+class ActiveVersionWatcher:
+    """Cheap per-request check for a swapped index: one stat() of the pointer file."""
+
+    def __init__(self, chroma_db_dir, base_name):
+        self.chroma_db_dir = chroma_db_dir
+        self.base_name = base_name
+        self._mtime = None
+        self.version = None
+
+    def poll(self):
+        """Return (version, changed) for the version that should be serving now."""
+        try:
+            mtime = os.stat(_pointer_path(self.chroma_db_dir)).st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+        if self.version is not None and mtime == self._mtime:
+            return self.version, False
+        self._mtime = mtime
+        version = active_version(self.chroma_db_dir, self.base_name)
+        changed = version != self.version
+        self.version = version
+        return version, changed
+
+
+class StoreWriteWatcher:
+    """Cheap check for writes to the store by other processes: one read of the write generation file."""
+
+    def __init__(self, chroma_db_dir):
+        self.chroma_db_dir = chroma_db_dir
+        self.generation = read_write_generation(chroma_db_dir)
+
+    def poll(self):
+        """True if another process wrote since the last poll (this process's own writes are already loaded)."""
+        generation = read_write_generation(self.chroma_db_dir)
+        changed = generation != self.generation and not (generation or "").startswith(f"{os.getpid()}:")
+        self.generation = generation
+        return changed
+
+
+# === Serving-side client management ===
+_client = None
+_client_pid = None
+
+
+def get_client(chroma_db_dir):
+    """This process's Chroma client, opened lazily (and reopened in a forked worker)."""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        import chromadb
+        _client = chromadb.PersistentClient(path=chroma_db_dir)
+        _client_pid = os.getpid()
+    return _client
+
+
+def release_client():
+    """Drop the client and every index it has loaded, so a swapped-out version's memory is freed."""
+    global _client
+    if _client is not None:
+        _client.clear_system_cache()
+    _client = None
+
+
+class SwapGuard:
+    """Lets many requests use the index at once, but makes a version swap wait for them to finish."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._swapping = False
+
+    @contextmanager
+    def reading(self):
+        with self._cond:
+            while self._swapping:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                self._cond.notify_all()
+
+    @contextmanager
+    def swapping(self):
+        with self._cond:
+            while self._swapping:
+                self._cond.wait()
+            self._swapping = True
+            while self._readers:
+                self._cond.wait()
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._swapping = False
+                self._cond.notify_all()
+
+
+class ServingIndex:
+    """Tracks the active version for a serving process and switches to a new one without a restart."""
+
+    def __init__(self, chroma_db_dir, base_name):
+        self.chroma_db_dir = chroma_db_dir
+        self.watcher = ActiveVersionWatcher(chroma_db_dir, base_name)
+        self.writes = StoreWriteWatcher(chroma_db_dir)
+        self.guard = SwapGuard()
+        self.version = None
+        self.generation = 0  # Bumped on every swap or reload so callers can drop cached collections
+
+    def refresh(self):
+        """Call outside `guard.reading()`: switch to a newly activated version, or reload the index after
+        another process (an upload in another worker, the ingest daemon) wrote to it, once in-flight
+        requests finish."""
+        version, changed = self.watcher.poll()
+        written = self.writes.poll()
+        if changed or written:
+            with self.guard.swapping():
+                if self.version is not None:
+                    if changed:
+                        print(f"🔀 Index swapped: {self.version} → {version}")
+                    else:
+                        print(f"🔄 Reloading {version}: another process wrote to it")
+                    release_client()  # Old or stale segments are never loaded alongside the new ones
+                self.version = version
+                self.generation += 1
+        return self.version
+
+    def reload(self):
+        """Call outside `guard.reading()`: reopen the store once in-flight requests finish."""
+        with self.guard.swapping():
+            release_client()
+            self.generation += 1
+
+    def retrying(self, search):
+        """Run `search()`; if it hit rows written by another process that this process's index has not
+        loaded yet (a write still in progress), reload and run it once more."""
+        try:
+            return search()
+        except Exception as e:
+            if not is_stale_index_error(e):
+                raise
+            print(f"🔄 Reloading {self.version} after a read of rows it had not loaded: {e}")
+        self.reload()
+        return search()
+
+    def client(self):
+        return get_client(self.chroma_db_dir)
+
+
+_serving_indexes = {}
+
+
+def serving_index(chroma_db_dir, base_name):
+    """The process-wide ServingIndex for `base_name`, shared by the query and upload paths."""
+    key = (chroma_db_dir, base_name)
+    if key not in _serving_indexes:
+        _serving_indexes[key] = ServingIndex(chroma_db_dir, base_name)
+    return _serving_indexes[key]
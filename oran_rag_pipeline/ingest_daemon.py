@@ -0,0 +1,560 @@
+import os
+import sys
+import json
+import time
+import queue
+import shutil
+import signal
+import sqlite3
+import hashlib
+import argparse
+import subprocess
+import threading
+import multiprocessing
+from functools import partial
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import step1_step2_document_loading_chunking as step1
+import step3_document_embedding as step3
+import step4_vector_store as step4
+from chunk_io import artifact_path, find_years
+from index_versions import ActiveVersionWatcher, active_version, ingest_lock
+from sharding import open_shards, fan_out_query, content_filter
+from title_index import add_titles, build_title_index, save_title_index, title_index_path
+
+# === Configuration ===
+INPUT_DIR = step1.INPUT_DIR  # Watched as INPUT_DIR/<year>/, the layout steps 1 & 2 read
+INGEST_STATE_PATH = os.path.join(step1.OUTPUT_BASE_DIR, "ingest_state.json")  # Hash and stat of every ingested file
+INGEST_METRICS_PATH = os.path.join(step1.OUTPUT_BASE_DIR, "ingest_metrics.json")  # Rewritten on every poll
+POLL_INTERVAL = 2.0  # Seconds between scans of the input tree
+SETTLE_SECONDS = 5.0  # A file is ingested once its size and mtime have not changed for this long
+EXTRACT_WORKERS = 2  # Extraction/chunking processes (PyMuPDF is not thread-safe); embedding and upsert run one at a time
+METRICS_PORT = 9110  # GET /metrics returns the metrics as JSON; None disables the endpoint
+LAG_WINDOW = 100  # Recent ingests kept for the lag percentiles
+MAX_EXTRACT_ATTEMPTS = 2  # A file that kills its extraction process this often while running alone is recorded as failed
+STORE_RETRIES = 4  # Attempts for a store that fails transiently (e.g. Chroma "database is locked")
+STORE_BACKOFF_SECONDS = 1.0  # Doubled after every transient failure
+TRANSIENT_ERROR_MARKERS = ("database is locked", "database is busy", "timed out")
+SUPPORTED_EXTENSIONS = (".pdf", ".docx")
+LAG_CHECK_PREFIX = "lagcheck-"  # File name prefix of the document --check-lag drops into the tree (and removes again)
+LAG_CHECK_TIMEOUT = 600  # Seconds the --check-lag probe waits for the document to become queryable
+LAG_CHECK_WARM_UP_QUERY = "O-RAN architecture"  # Run by the probe before the upsert, so it holds a loaded index like a server
+
+
+def year_dirs(input_dir=INPUT_DIR):
+    """(year, path) for every year directory under `input_dir`, found the same way as steps 1–4 find them."""
+    return [(year, os.path.join(input_dir, year)) for year in find_years(input_dir)]
+
+
+def scan(input_dir=INPUT_DIR):
+    """{path: (year, mtime_ns, size)} for every supported document in the watched tree."""
+    found = {}
+    for year, directory in year_dirs(input_dir):
+        for entry in os.scandir(directory):
+            name = entry.name
+            # Hidden files, Office lock files (~$x.docx) and partial downloads are never ingested
+            if name.startswith((".", "~$")) or not name.lower().endswith(SUPPORTED_EXTENSIONS) or not entry.is_file():
+                continue
+            stat = entry.stat()
+            found[entry.path] = (year, stat.st_mtime_ns, stat.st_size)
+    return found
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_state(path=INGEST_STATE_PATH):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_json(data, path):
+    """Write atomically (temp file + rename), so readers never see a partial file."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = os.path.join(os.path.dirname(path), f".tmp-{os.path.basename(path)}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4)
+    os.replace(tmp_path, path)
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def ingest_record(signature, sha256=None):
+    """State entry for a file; sha256 is None when it could not be indexed."""
+    _, mtime_ns, size = signature
+    return {"mtime_ns": mtime_ns, "size": size, "sha256": sha256, "ingested_at": time.time()}
+
+
+def is_transient(error):
+    """Whether a store failure is worth retrying: a busy database or a timeout, not a bad document."""
+    if isinstance(error, (sqlite3.OperationalError, TimeoutError, ConnectionError)):
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in TRANSIENT_ERROR_MARKERS)
+
+
+def extract_document(path, year, known_sha256):
+    """Runs in an extraction process: hash the file and, if its content changed, run steps 1 & 2 on it."""
+    sha256 = file_sha256(path)
+    result = {"path": path, "year": year, "sha256": sha256, "chunks_path": None, "chunks": 0}
+    if sha256 == known_sha256:
+        return result  # Touched or copied over with identical content
+
+    text_output_dir = os.path.join(step1.OUTPUT_BASE_DIR, f"Output_{year}")
+    chunks_output_dir = os.path.join(step1.CHUNKS_OUTPUT_BASE_DIR, f"Output_{year}")
+    os.makedirs(text_output_dir, exist_ok=True)
+    os.makedirs(chunks_output_dir, exist_ok=True)
+    result["chunks"] = step1.process_file(path, text_output_dir, chunks_output_dir) or 0
+    if result["chunks"]:
+        document_name = os.path.splitext(os.path.basename(path))[0]
+        result["chunks_path"] = artifact_path(os.path.join(chunks_output_dir, f"{document_name}_chunks"))
+    return result
+
+
+class IngestDaemon:
+    """Polls INPUT_DIR/<year>/ and pushes new or changed documents through steps 1–4 into the active version.
+
+    A file is picked up once its size and mtime have been stable for SETTLE_SECONDS (so partial
+    writes are never read) and only if its sha256 differs from the last ingested copy. Extraction
+    and chunking run in EXTRACT_WORKERS processes. Embedding and the upsert run on one thread,
+    which also reapplies step 4's ingestion to whichever version is active after a swap.
+
+    Only deterministic failures are recorded (and retried once the file changes). A dead extraction
+    process fails every file in flight, so those become suspects: each is re-extracted alone on a
+    fresh pool, and only a crash while alone counts against a file. Transient store errors are
+    retried with backoff and otherwise left for the next poll.
+    """
+
+    def __init__(self, input_dir=INPUT_DIR, workers=EXTRACT_WORKERS, state_path=INGEST_STATE_PATH,
+                 metrics_path=INGEST_METRICS_PATH):
+        self.input_dir = input_dir
+        self.workers = workers
+        self.state_path = state_path
+        self.metrics_path = metrics_path
+        self.state = load_state(state_path)  # path -> {"mtime_ns", "size", "sha256", "ingested_at"}
+
+        self._lock = threading.RLock()  # Re-entrant: a future that is already done runs its callback inside poll()
+        self._settling = {}  # path -> ((year, mtime_ns, size), unchanged since)
+        self._pending = deque()  # Settled paths waiting for an extraction process: (path, year, queued at)
+        self._queued = set()  # Paths pending, extracting or waiting to be embedded
+        self._extracting = 0
+        self._suspects = deque()  # In flight when an extraction process died: re-extracted one at a time
+        self._crashes = {}  # path -> extraction process crashes while it was the only file in flight
+        self._isolating = False  # A suspect is extracting alone: nothing else starts until it finishes
+        self._broken_pool = None  # The pool a dead worker broke; replaced on the next poll
+        self._embed_queue = queue.Queue()  # (extraction result, stat at queue time, queued at)
+        self._embedding = 0
+        self._lags = deque(maxlen=LAG_WINDOW)
+        self.counters = {"ingested": 0, "unchanged": 0, "failed": 0, "requeued": 0, "pool_restarts": 0, "rows_upserted": 0}
+        self.last_ingest = None
+        self._stop = threading.Event()
+        self._extraction_done = threading.Event()  # Set on shutdown once no extraction can still queue work
+
+        self._watcher = ActiveVersionWatcher(step4.CHROMA_DB_DIR, step4.COLLECTION_NAME)
+        self._pool = self._new_pool()
+
+    def _new_pool(self):
+        context = multiprocessing.get_context("spawn")  # Like embedding_pool.py: no forked torch/Chroma state
+        return ProcessPoolExecutor(max_workers=self.workers, mp_context=context)
+
+    def _restart_pool(self):
+        """Replace a pool broken by a dead worker (segfault, OOM kill); its futures already failed."""
+        self._pool.shutdown(wait=False)
+        self._pool = self._new_pool()
+        self._broken_pool = None
+        self.counters["pool_restarts"] += 1
+        print("♻️ An extraction process died; restarted the extraction pool")
+
+    # === Polling ===
+    def poll(self):
+        """One scan: advance settling files, queue the settled ones and start extractions."""
+        now = time.time()
+        seen = scan(self.input_dir)
+        with self._lock:
+            for path in list(self._settling):
+                if path not in seen:
+                    del self._settling[path]  # Deleted or renamed before it settled
+
+            for path, signature in seen.items():
+                year, mtime_ns, size = signature
+                known = self.state.get(path)
+                if path in self._queued or (known and (known["mtime_ns"], known["size"]) == (mtime_ns, size)):
+                    continue  # In progress (a later poll catches further changes) or already ingested
+                previous = self._settling.get(path)
+                if previous is None or previous[0] != signature:
+                    self._settling[path] = (signature, now)  # New, or still being written
+                elif now - previous[1] >= SETTLE_SECONDS:
+                    del self._settling[path]
+                    self._queued.add(path)
+                    self._pending.append((path, year, now))
+
+            if self._broken_pool is self._pool:
+                self._restart_pool()
+            if self._suspects or self._isolating:
+                # Nothing else starts until every suspect has run alone, so a crash identifies its file
+                if self._suspects and not self._extracting:
+                    self._isolating = True
+                    self._submit(*self._suspects.popleft(), seen, alone=True)
+            else:
+                while self._pending and self._extracting < self.workers:
+                    self._submit(*self._pending.popleft(), seen, alone=self.workers == 1)
+        self.write_metrics()
+
+    def _submit(self, path, year, queued_at, seen, alone=False):
+        """Start extracting `path` (call with the lock held); `alone`: no other file shares the pool meanwhile."""
+        signature = seen.get(path)
+        if signature is None:
+            self._queued.discard(path)  # Deleted while it waited
+            self._isolating = False
+            return
+        known_sha256 = (self.state.get(path) or {}).get("sha256")
+        try:
+            future = self._pool.submit(extract_document, path, year, known_sha256)
+        except BrokenProcessPool:
+            self._restart_pool()
+            future = self._pool.submit(extract_document, path, year, known_sha256)
+        future.add_done_callback(partial(self._extracted, path, signature, queued_at, self._pool, alone))
+        self._extracting += 1
+
+    def _extracted(self, path, signature, queued_at, pool, alone, future):
+        if alone:
+            with self._lock:
+                self._isolating = False  # Set again by poll() if more suspects are waiting
+        try:
+            self._embed_queue.put((future.result(), signature, queued_at))
+        except BrokenProcessPool:
+            # Runs on the pool's own thread, so the pool is replaced by the next poll(), not here
+            crashes = 0
+            with self._lock:
+                self._broken_pool = pool
+                if alone:
+                    crashes = self._crashes[path] = self._crashes.get(path, 0) + 1
+                if crashes < MAX_EXTRACT_ATTEMPTS:
+                    self._suspects.append((path, signature[0], queued_at))
+                    self.counters["requeued"] += 1
+            if crashes >= MAX_EXTRACT_ATTEMPTS:
+                print(f"❌ Extraction process died {crashes} times while extracting only {path}; skipping it until it changes")
+                self._finish(path, ingest_record(signature))
+        except Exception as e:
+            print(f"❌ Extraction failed for {path}: {e}")
+            self._finish(path, ingest_record(signature))
+        with self._lock:
+            self._extracting -= 1
+
+    # === Embedding and upsert ===
+    def embed_loop(self):
+        while not self._extraction_done.is_set() or not self._embed_queue.empty():
+            try:
+                result, signature, queued_at = self._embed_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            with self._lock:
+                self._embedding += 1
+            try:
+                self.store_with_retries(result, signature, queued_at)
+            finally:
+                with self._lock:
+                    self._embedding -= 1
+
+    def store_with_retries(self, result, signature, queued_at):
+        """store(), retrying transient failures with backoff; only deterministic failures are recorded."""
+        path = result["path"]
+        backoff = STORE_BACKOFF_SECONDS
+        for attempt in range(1, STORE_RETRIES + 1):
+            try:
+                return self.store(result, signature, queued_at)
+            except Exception as e:
+                if not is_transient(e):
+                    print(f"❌ Ingest failed for {path}: {e}")
+                    self._finish(path, ingest_record(signature))
+                    return
+                if attempt == STORE_RETRIES:
+                    print(f"⚠️ Ingest of {path} still failing after {attempt} attempts ({e}); retrying on a later poll")
+                    with self._lock:
+                        self._queued.discard(path)  # Not recorded, so the next poll settles and queues it again
+                        self.counters["requeued"] += 1
+                    return
+                print(f"⏳ Transient failure ingesting {path} ({e}); retrying in {backoff:.0f}s")
+                time.sleep(backoff)
+                backoff *= 2
+
+    def store(self, result, signature, queued_at):
+        """Embed a chunked document (step 3) and upsert it into the active version (step 4)."""
+        path, year = result["path"], result["year"]
+        record = ingest_record(signature, result["sha256"])
+        if result["chunks_path"] is None:
+            if result["sha256"] == (self.state.get(path) or {}).get("sha256"):
+                self._finish(path, record, outcome="unchanged")
+            else:
+                self._finish(path, ingest_record(signature))  # Unsupported or empty
+            return
+
+        document_name = os.path.splitext(os.path.basename(path))[0]
+        embeddings_output_dir = os.path.join(step3.EMBEDDINGS_OUTPUT_BASE_DIR, f"Output_{year}")
+        os.makedirs(embeddings_output_dir, exist_ok=True)
+        embeddings_path = artifact_path(os.path.join(embeddings_output_dir, f"{document_name}_embeddings"))
+        step3.process_file(result["chunks_path"], embeddings_path)
+
+        # Same lock as Flask uploads and step 4's swap; the active version is read under it, so a
+        # swap can't happen between choosing the version and writing to it
+        with ingest_lock(step4.CHROMA_DB_DIR):
+            step4.sync_client()  # Reopened if a Flask upload wrote since the last file
+            version, changed = self._watcher.poll()
+            if changed:  # A step 4 rebuild swapped versions: write to the new one
+                step4.target_version = version
+                step4.collections.clear()
+            rows = step4.store_file(embeddings_path, year, prune=True)
+            add_titles(step4.CHROMA_DB_DIR, version, [document_name], open_shards(step4.get_chroma_client(), version))
+
+        lag = time.time() - signature[1] / 1e9  # From the last write to the file until it is queryable
+        with self._lock:
+            self.counters["rows_upserted"] += rows
+            self._lags.append(lag)
+        print(f"📥 Indexed {os.path.basename(path)}: {rows} rows into {version} | lag {lag:.1f}s, queued {time.time() - queued_at:.1f}s")
+        self._finish(path, record, outcome="ingested")
+
+    def _finish(self, path, record, outcome="failed"):
+        """Record the outcome; failed files are recorded too, so they are only retried once they change."""
+        with self._lock:
+            self._queued.discard(path)
+            self._crashes.pop(path, None)
+            self.counters[outcome] += 1
+            self.state[path] = record
+            save_json(self.state, self.state_path)
+            if outcome == "ingested":
+                self.last_ingest = record["ingested_at"]
+
+    # === Metrics ===
+    def metrics(self):
+        now = time.time()
+        with self._lock:
+            oldest = min((queued_at for _, _, queued_at in (*self._pending, *self._suspects)), default=None)
+            lags = list(self._lags)
+            return {
+                "queue_depth": len(self._pending) + len(self._suspects) + self._embed_queue.qsize(),
+                "crash_suspects": len(self._suspects),
+                "settling": len(self._settling),
+                "extracting": self._extracting,
+                "embedding": self._embedding,
+                "oldest_queued_seconds": round(now - oldest, 1) if oldest is not None else 0.0,
+                "lag_last_seconds": round(lags[-1], 2) if lags else None,
+                "lag_p50_seconds": round(percentile(lags, 50), 2) if lags else None,
+                "lag_p95_seconds": round(percentile(lags, 95), 2) if lags else None,
+                "last_ingest_at": self.last_ingest,
+                "tracked_files": len(self.state),
+                **self.counters,
+            }
+
+    def write_metrics(self):
+        save_json(self.metrics(), self.metrics_path)
+
+    def serve_metrics(self, port=METRICS_PORT):
+        daemon = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                data = json.dumps(daemon.metrics()).encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        server = ThreadingHTTPServer(("0.0.0.0", port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        print(f"📈 Metrics on http://0.0.0.0:{port}/metrics")
+        return server
+
+    # === Lifecycle ===
+    def idle(self):
+        with self._lock:
+            return not (self._settling or self._queued)  # A path stays queued until its outcome is recorded
+
+    def baseline(self):
+        """Record every file already in the tree as ingested (it was indexed by run_pipeline.sh)."""
+        for path, signature in scan(self.input_dir).items():
+            self.state[path] = ingest_record(signature, file_sha256(path))
+        save_json(self.state, self.state_path)
+        print(f"📌 Baseline: {len(self.state)} files marked as already indexed")
+
+    def stop(self, *_):
+        self._stop.set()
+
+    def run(self, poll_interval=POLL_INTERVAL, once=False, metrics_port=METRICS_PORT):
+        """Poll until stopped (SIGINT/SIGTERM), or with `once` until the current backlog is indexed."""
+        print(f"👀 Watching {self.input_dir}/<year>/ every {poll_interval}s ({self.workers} extraction workers)")
+        step3.get_model()  # Load the embedder before the first file arrives
+        server = self.serve_metrics(metrics_port) if metrics_port else None
+        embedder = threading.Thread(target=self.embed_loop, daemon=True)
+        embedder.start()
+        try:
+            while not self._stop.is_set():
+                self.poll()
+                if once and self.idle():
+                    break
+                self._stop.wait(poll_interval)
+        finally:
+            self._stop.set()
+            self._pool.shutdown(wait=True)  # Finish extractions in progress; their results are still embedded
+            self._extraction_done.set()
+            embedder.join()
+            self.write_metrics()
+            if server:
+                server.shutdown()
+        print(f"🛑 Ingest daemon stopped: {json.dumps(self.counters)}")
+
+
+def probe_visibility(title, timeout=LAG_CHECK_TIMEOUT):
+    """Runs in its own process: vector-search the document through step 5 until it is found and print when.
+
+    The probe queries before the upsert, so its index is already loaded: it only finds the document
+    if serving processes pick up writes made by another process.
+    """
+    import step5_retrieval as step5  # Loads the embedder and follows the active version like a query process
+
+    step5.retrieve_relevant_chunks(LAG_CHECK_WARM_UP_QUERY)
+    query_embedding = step5.embed_query(title)
+
+    def search():
+        hits, _ = fan_out_query(step5.get_collections(), query_embedding, 1,
+                                where=lambda collection: content_filter(collection, {"title": title}))
+        return hits
+
+    print("ready", flush=True)
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if step5.serving.retrying(search):
+                print(f"visible {time.time()}", flush=True)
+                return
+        except Exception as e:
+            print(f"error {e}", flush=True)
+            return
+        time.sleep(0.2)
+    print("timeout", flush=True)
+
+
+def remove_document(path, year, document_name, state_path=INGEST_STATE_PATH):
+    """Undo a --check-lag ingest: the watched file, its step 1–3 outputs, its rows, its title and its state entry."""
+    text_output_dir = os.path.join(step1.OUTPUT_BASE_DIR, f"Output_{year}")
+    outputs = [
+        path,
+        os.path.join(text_output_dir, f"{document_name}_text.json"),
+        artifact_path(os.path.join(step1.CHUNKS_OUTPUT_BASE_DIR, f"Output_{year}", f"{document_name}_chunks")),
+        artifact_path(os.path.join(step3.EMBEDDINGS_OUTPUT_BASE_DIR, f"Output_{year}", f"{document_name}_embeddings")),
+    ]
+    for output in outputs:
+        if os.path.exists(output):
+            os.remove(output)  # A later full rebuild would otherwise index the embeddings again
+
+    with ingest_lock(step4.CHROMA_DB_DIR):
+        step4.sync_client()
+        version = active_version(step4.CHROMA_DB_DIR, step4.COLLECTION_NAME)
+        collections = open_shards(step4.get_chroma_client(), version)
+        for collection in collections.values():
+            collection.delete(where={"title": document_name})
+        save_title_index(build_title_index(collections), title_index_path(step4.CHROMA_DB_DIR, version))
+
+    state = load_state(state_path)
+    state.pop(path, None)
+    save_json(state, state_path)
+
+
+def check_lag(source, year=None, poll_interval=POLL_INTERVAL, timeout=LAG_CHECK_TIMEOUT):
+    """Measure ingest-to-queryable lag across processes.
+
+    A separate process polls step 5's serving path for the document while a copy of `source` is
+    dropped into INPUT_DIR/<year>/ and a --once run indexes it. The copy is removed afterwards.
+    Run it after --baseline, or the --once run re-indexes the whole tree first.
+    """
+    if year is None:
+        years = year_dirs()
+        year = years[-1][0] if years else time.strftime("%Y")
+    name = f"{LAG_CHECK_PREFIX}{time.strftime('%Y%m%d-%H%M%S')}-{os.path.basename(source)}"
+    document_name = os.path.splitext(name)[0]
+    target = os.path.join(INPUT_DIR, year, name)
+
+    probe = subprocess.Popen([sys.executable, os.path.abspath(__file__), "--probe", document_name, "--timeout", str(timeout)],
+                             stdout=subprocess.PIPE, text=True)
+    if probe.stdout.readline().strip() != "ready":
+        probe.kill()
+        raise SystemExit("❌ Lag probe failed to start")
+
+    try:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(source, target)
+        written_at = os.stat(target).st_mtime
+        print(f"⏱️ Copied {os.path.basename(source)} to {target}; probing from process {probe.pid}")
+
+        daemon = IngestDaemon()
+        daemon.run(poll_interval, once=True, metrics_port=None)
+        indexed_at = time.time()
+        if not (daemon.state.get(target) or {}).get("sha256"):
+            probe.kill()
+            raise SystemExit(f"❌ {name} was not indexed; see the errors above")
+
+        reply = probe.communicate(timeout=timeout + 10)[0].split(maxsplit=1)
+        if reply[:1] == ["error"]:
+            raise SystemExit(f"❌ Query from another process failed after the ingest: {reply[1]}")
+        if reply[:1] != ["visible"]:
+            raise SystemExit(f"❌ {name} was indexed but not queryable from another process within {timeout}s")
+        visible_at = float(reply[1])
+        print(f"🏁 Lag from the last write to queryable from another process: {visible_at - written_at:.1f}s "
+              f"(indexed after {indexed_at - written_at:.1f}s, including the {SETTLE_SECONDS:.0f}s settle time)")
+        return visible_at - written_at
+    finally:
+        if probe.poll() is None:
+            probe.kill()
+        remove_document(target, year, document_name)
+        print(f"🧹 Removed {name} from the tree and the index")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Watch INPUT_DIR/<year>/ and index new or changed documents continuously.")
+    parser.add_argument("--workers", type=int, default=EXTRACT_WORKERS, help="Extraction/chunking processes")
+    parser.add_argument("--poll-interval", type=float, default=POLL_INTERVAL)
+    parser.add_argument("--metrics-port", type=int, default=METRICS_PORT, help="0 disables the /metrics endpoint")
+    parser.add_argument("--once", action="store_true", help="Index what is new or changed now, then exit")
+    parser.add_argument("--baseline", action="store_true",
+                        help="Mark every file currently in the tree as indexed and exit (after a full run_pipeline.sh)")
+    parser.add_argument("--check-lag", metavar="DOCUMENT",
+                        help="Copy DOCUMENT into the tree, index it with --once and report when another process can query it")
+    parser.add_argument("--year", help="Year directory for --check-lag (default: the latest one)")
+    parser.add_argument("--probe", help=argparse.SUPPRESS)  # The --check-lag query process
+    parser.add_argument("--timeout", type=float, default=LAG_CHECK_TIMEOUT, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.probe:
+        probe_visibility(args.probe, args.timeout)
+    elif args.check_lag:
+        check_lag(args.check_lag, args.year, args.poll_interval, args.timeout)
+    else:
+        daemon = IngestDaemon(workers=args.workers)
+        if args.baseline:
+            daemon.baseline()
+        else:
+            signal.signal(signal.SIGTERM, daemon.stop)
+            signal.signal(signal.SIGINT, daemon.stop)
+            daemon.run(args.poll_interval, args.once, args.metrics_port)
@@ -0,0 +1,106 @@
+import io
+import os
+import json
+import time
+import pstats
+import cProfile
+from contextlib import contextmanager
+
+# === Configuration ===
+PROFILE_OUTPUT_DIR = "/home/sswarna/Documents/oran_docs/output_all/profiles"
+TOP_FUNCTIONS = 15  # Functions listed by cumulative time in the console report
+
+# Counter name -> label of its throughput in the summary
+RATE_LABELS = {
+    "pages": "pages/sec",
+    "tokens": "tokens/sec",
+    "chunks": "chunks embedded/sec",
+    "rows": "rows upserted/sec",
+}
+
+
+class StepProfiler:
+    """cProfile capture, per-file timings and throughput for one pipeline step.
+
+    Disabled profilers cost nothing: `file()` still yields a counters dict, but nothing is recorded.
+    """
+
+    def __init__(self, step_name, enabled=False, output_dir=PROFILE_OUTPUT_DIR):
+        self.step_name = step_name
+        self.enabled = enabled
+        self.output_dir = output_dir
+        self.files = []
+        self._profile = cProfile.Profile() if enabled else None
+        self._start = None
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        if self.enabled:
+            self._profile.enable()
+        return self
+
+    @contextmanager
+    def file(self, name):
+        """Time one input file; the caller fills the yielded dict with pages/tokens/chunks/rows."""
+        counters = {}
+        start = time.perf_counter()
+        yield counters
+        if self.enabled:
+            elapsed = time.perf_counter() - start
+            record = {"file": name, "seconds": round(elapsed, 4), **counters}
+            for counter, label in RATE_LABELS.items():
+                if counter in counters and elapsed > 0:
+                    record[label] = round(counters[counter] / elapsed, 2)
+            self.files.append(record)
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.enabled:
+            return False
+        self._profile.disable()
+        wall_seconds = time.perf_counter() - self._start
+
+        totals = {"files": len(self.files), "wall_seconds": round(wall_seconds, 3)}
+        file_seconds = sum(record["seconds"] for record in self.files)
+        for counter, label in RATE_LABELS.items():
+            values = [record[counter] for record in self.files if counter in record]
+            if values:
+                totals[counter] = sum(values)
+                totals[label] = round(totals[counter] / file_seconds, 2) if file_seconds else None
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        prof_path = os.path.join(self.output_dir, f"{self.step_name}_{stamp}.prof")
+        summary_path = os.path.join(self.output_dir, f"{self.step_name}_{stamp}.json")
+        self._profile.dump_stats(prof_path)
+
+        summary = {"step": self.step_name, "started": stamp, "totals": totals, "files": self.files, "cprofile": prof_path}
+        latest_path = os.path.join(self.output_dir, f"{self.step_name}_latest.json")
+        previous = None
+        if os.path.exists(latest_path):
+            with open(latest_path, "r", encoding="utf-8") as f:
+                previous = json.load(f)
+        for path in (summary_path, latest_path):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(summary, f, indent=4)
+
+        report = io.StringIO()
+        pstats.Stats(self._profile, stream=report).sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        print(report.getvalue())
+        rates = ", ".join(f"{totals[label]} {label}" for label in RATE_LABELS.values() if totals.get(label) is not None)
+        print(f"⏱️ {self.step_name}: {totals['files']} files in {wall_seconds:.1f}s | {rates}")
+        if previous:
+            # Throughput change against the previous profiled run of this step
+            for label in RATE_LABELS.values():
+                before, after = previous["totals"].get(label), totals.get(label)
+                if before and after is not None:
+                    change = (after - before) / before
+                    flag = "⚠️" if change < -0.1 else "  "
+                    print(f"{flag} {label}: {before} → {after} ({change:+.0%} vs run {previous['started']})")
+        print(f"📊 Profile summary: {summary_path} (cProfile: {prof_path})")
+        return False
+
+def add_profile_argument(parser):
+    """Add the shared --profile flag to a step's argument parser."""
+    parser.add_argument("--profile", action="store_true",
+                        help=f"Capture cProfile output and per-file throughput into {PROFILE_OUTPUT_DIR}")
+    return parser
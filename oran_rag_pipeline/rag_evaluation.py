@@ -6,10 +6,16 @@ import numpy as np
 import faiss
 import pandas as pd
 from prettytable import PrettyTable
-from sentence_transformers import SentenceTransformer, util
+from sentence_transformers import util
 from nltk.translate.bleu_score import sentence_bleu, SmoothingFunction
 from rouge_score import rouge_scorer
 from chromadb import PersistentClient
+from embedding_backend import load_embedder
+from ollama_client import OllamaClient, OllamaBusyError
+from sharding import open_shards, fan_out_query, content_filter
+from index_versions import active_version
+from grounding import grounding_score
+from context_compression import compress_chunks, format_compression
 
 # === Configuration ===
 CHROMA_DB_DIR = "/home/sswarna/Documents/oran_docs/oran_rag_pipeline/chroma_index"
@@ -18,13 +24,17 @@ EMBEDDING_MODEL_PATH = "/home/sswarna/models/all-MiniLM-L12-v2"
 OLLAMA_URL = "http://localhost:11434/api/generate"
 OLLAMA_MODEL = "llama2:7b"
 TOP_K = 50  # Increased from 5 to 50
+EVAL_COMPRESSION_RATIOS = [1.0, 0.5, 0.3]  # Each ratio is a full run; 1.0 is the uncompressed baseline
 
 # Load local embedding model
-embed_model = SentenceTransformer(EMBEDDING_MODEL_PATH)
+embed_model = load_embedder(EMBEDDING_MODEL_PATH)  # Same backend as ingestion (embedding_backend.py)
 
-# Initialize ChromaDB
+# Initialize ChromaDB (evaluates whichever index version is active when the run starts)
 chroma_client = PersistentClient(path=CHROMA_DB_DIR)
-collection = chroma_client.get_collection(COLLECTION_NAME)
+shard_collections = open_shards(chroma_client, active_version(CHROMA_DB_DIR, COLLECTION_NAME))
+
+# Shared, pooled Ollama client
+ollama_client = OllamaClient(OLLAMA_URL, OLLAMA_MODEL)
 
 # === Test Queries and Expected Answers ===
 test_queries = {
@@ -91,40 +101,40 @@ def compute_semantic_similarity(references, generations):
     gen_embeddings = embed_model.encode(generations, convert_to_tensor=True)
     return util.cos_sim(gen_embeddings, ref_embeddings).mean().item()
 
-def knowledge_grounding_score(retrieved, generated):
-    """Check if generated content aligns with retrieved context."""
-    retrieved_embeds = embed_model.encode(retrieved, convert_to_tensor=True)
-    generated_embeds = embed_model.encode(generated, convert_to_tensor=True)
-    return util.cos_sim(generated_embeds, retrieved_embeds).mean().item()
+def knowledge_grounding_score(retrieved_embeddings, generated):
+    """Check if generated content aligns with retrieved context.
+
+    Sentence-level: each answer sentence against the chunks' stored embeddings (see grounding.py),
+    instead of re-encoding the concatenated context, which the model would truncate anyway.
+    """
+    grounding = grounding_score(embed_model, generated, retrieved_embeddings)
+    return grounding or {"confidence": 0.0, "faithfulness": 0.0}
 
 # === Improved Retrieval Function ===
 def retrieve_relevant_chunks(query, top_k=TOP_K):
-    """Retrieve relevant document chunks and remove noise (tables, lists)."""
+    """Retrieve relevant document chunks, skipping boilerplate tagged at ingestion.
+
+    Returns (chunk texts, their stored embeddings).
+    """
     query_embedding = embed_model.encode(query).tolist()
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=top_k,
-        include=["documents", "metadatas", "distances"]
-    )
-    raw_chunks = [results["documents"][0][i] for i in range(len(results["documents"][0]))]
-
-    # Remove irrelevant metadata (tables, figures, list items)
-    cleaned_chunks = [chunk for chunk in raw_chunks if not any(tag in chunk.lower() for tag in ["table", "figure", "list", "appendix"])]
-    
-    return cleaned_chunks if cleaned_chunks else raw_chunks  # Fallback if everything is filtered
+    # TOC, list-of-figures, IPR and copyright chunks never take a top-k slot
+    hits, _ = fan_out_query(shard_collections, query_embedding, top_k, where=content_filter, include_embeddings=True)
+    return [hit["document"] for hit in hits], [hit["embedding"] for hit in hits]
 
 # === Improved LLM Query Function ===
+# Sent as Ollama's `system` prompt, so every evaluation call shares the same cached prefix
+EVAL_SYSTEM_PROMPT = """### Instructions for LLM:
+- **Strictly answer based on retrieved context only.**
+- **Keep responses under 50 words.**
+- **Use exact document phrasing where applicable.**
+"""
+
 def call_ollama_llm(query, retrieved_chunks):
     """Calls Ollama LLM API to generate an answer using retrieved context."""
     context = "\n".join(retrieved_chunks)
 
-    # Improved prompt for **precise & concise** answers
+    # Improved prompt for **precise & concise** answers; the fixed instructions go in EVAL_SYSTEM_PROMPT
     llm_prompt = f"""
-    ### Instructions for LLM:
-    - **Strictly answer based on retrieved context only.**
-    - **Keep responses under 50 words.**
-    - **Use exact document phrasing where applicable.**
-    
     ### Retrieved Context:
     {context}
 
@@ -132,39 +142,60 @@ def call_ollama_llm(query, retrieved_chunks):
     {query}
     """
 
-    response = requests.post(OLLAMA_URL, json={"model": OLLAMA_MODEL, "prompt": llm_prompt, "stream": False})
-    return response.json().get("response", "⚠️ No response from Ollama.") if response.status_code == 200 else "Error"
+    try:
+        return ollama_client.generate(llm_prompt, system=EVAL_SYSTEM_PROMPT).get("response", "⚠️ No response from Ollama.")
+    except (requests.RequestException, OllamaBusyError):
+        return "Error"
 
 # === Run Evaluation ===
 results = []
 table_data = []
 
-for category, queries in test_queries.items():
-    print(f"\n🔍 Evaluating Category: {category}\n")
-    for i, query in enumerate(queries):
-        retrieved_chunks = retrieve_relevant_chunks(query)
-        generated_answer = call_ollama_llm(query, retrieved_chunks)
-        reference_answer = expected_answers[category][i]
-
-        # Compute Evaluation Metrics
-        bleu = compute_bleu(reference_answer, generated_answer)
-        rouge = compute_rouge(reference_answer, generated_answer)
-        semantic_similarity = compute_semantic_similarity([reference_answer], [generated_answer])
-        kg_score = knowledge_grounding_score([" ".join(retrieved_chunks)], generated_answer)
-
-        # Store Results
-        results.append({
-            "category": category,
-            "query": query,
-            "generated_answer": generated_answer,
-            "BLEU": bleu,
-            "ROUGE-1": rouge,
-            "Semantic Similarity": semantic_similarity,
-            "KG Score": kg_score
-        })
-
-        # Store Table Data
-        table_data.append([category, query, f"{bleu:.4f}", f"{rouge:.4f}", f"{semantic_similarity:.4f}", f"{kg_score:.4f}"])
+# Load the model up front so the first query doesn't include Ollama's model-load time
+try:
+    print(f"🔥 {OLLAMA_MODEL} loaded in {ollama_client.warm_up():.1f}s")
+except (requests.RequestException, OllamaBusyError) as e:
+    print(f"⚠️ Ollama warm-up failed: {e}")
+
+for compression_ratio in EVAL_COMPRESSION_RATIOS:
+    print(f"\n🗜️ Context compression ratio: {compression_ratio}")
+    for category, queries in test_queries.items():
+        print(f"\n🔍 Evaluating Category: {category}\n")
+        for i, query in enumerate(queries):
+            retrieved_chunks, retrieved_embeddings = retrieve_relevant_chunks(query)
+            compressed, compression = compress_chunks(
+                embed_model, query,
+                [{"content": chunk, "embedding": embedding} for chunk, embedding in zip(retrieved_chunks, retrieved_embeddings)],
+                compression_ratio
+            )
+            print(f"🗜️ {format_compression(compression)}")
+            generated_answer = call_ollama_llm(query, [chunk["content"] for chunk in compressed])
+            reference_answer = expected_answers[category][i]
+
+            # Compute Evaluation Metrics
+            bleu = compute_bleu(reference_answer, generated_answer)
+            rouge = compute_rouge(reference_answer, generated_answer)
+            semantic_similarity = compute_semantic_similarity([reference_answer], [generated_answer])
+            grounding = knowledge_grounding_score([chunk["embedding"] for chunk in compressed], generated_answer)
+            kg_score = grounding["confidence"]
+
+            # Store Results
+            results.append({
+                "compression_ratio": compression_ratio,
+                "category": category,
+                "query": query,
+                "generated_answer": generated_answer,
+                "BLEU": bleu,
+                "ROUGE-1": rouge,
+                "Semantic Similarity": semantic_similarity,
+                "KG Score": kg_score,
+                "Faithfulness": grounding["faithfulness"],
+                "Context Tokens": compression["tokens_after"],
+                "Tokens Saved": compression["tokens_before"] - compression["tokens_after"]
+            })
+
+            # Store Table Data
+            table_data.append([compression_ratio, category, query, f"{bleu:.4f}", f"{rouge:.4f}", f"{semantic_similarity:.4f}", f"{kg_score:.4f}"])
 
 # Save results
 with open("rag_evaluation_results.json", "w", encoding="utf-8") as f:
@@ -172,10 +203,25 @@ with open("rag_evaluation_results.json", "w", encoding="utf-8") as f:
 
 # === Print Summary Table ===
 summary_table = PrettyTable()
-summary_table.field_names = ["Category", "Query", "BLEU", "ROUGE-1", "Semantic Similarity", "KG Score"]
+summary_table.field_names = ["Ratio", "Category", "Query", "BLEU", "ROUGE-1", "Semantic Similarity", "KG Score"]
 for row in table_data:
     summary_table.add_row(row)
 
 print("\n📊 **Final Evaluation Summary** 📊")
 print(summary_table)
+
+# === Effect of Context Compression ===
+compression_table = PrettyTable()
+compression_table.field_names = ["Ratio", "Avg Context Tokens", "Tokens Saved", "BLEU", "ROUGE-1", "Semantic Similarity", "KG Score"]
+for compression_ratio in EVAL_COMPRESSION_RATIOS:
+    run = pd.DataFrame([result for result in results if result["compression_ratio"] == compression_ratio])
+    compression_table.add_row([
+        compression_ratio,
+        f"{run['Context Tokens'].mean():.0f}",
+        f"{run['Tokens Saved'].sum() / max(run['Context Tokens'].sum() + run['Tokens Saved'].sum(), 1):.0%}",
+        *(f"{run[metric].mean():.4f}" for metric in ["BLEU", "ROUGE-1", "Semantic Similarity", "KG Score"])
+    ])
+
+print("\n🗜️ **Context Compression vs. Quality** 🗜️")
+print(compression_table)
 print("\n🎯 Evaluation Complete! Results saved to rag_evaluation_results.json")
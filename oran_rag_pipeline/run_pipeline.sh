@@ -3,14 +3,22 @@ echo "🚀 Starting the O-RAN RAG Pipeline Execution... 🔥"
 
 BASE_DIR="/home/sswarna/Documents/oran_docs/oran_rag_pipeline"
 
+# Usage: run_pipeline.sh [--profile]
+# --profile: each ingestion step writes cProfile output and a JSON throughput summary
+STEP_ARGS=""
+if [ "$1" == "--profile" ]; then
+    STEP_ARGS="--profile"
+    echo "⏱️ Profiling enabled for steps 1–4"
+fi
+
 echo "🔹 Running Step 1 & 2: Document Loading & Chunking..."
-python3 $BASE_DIR/step1_step2_document_loading_chunking.py && echo "✅ Step 1 & 2 Completed!"
+python3 $BASE_DIR/step1_step2_document_loading_chunking.py $STEP_ARGS && echo "✅ Step 1 & 2 Completed!"
 
 echo "🔹 Running Step 3: Document Embedding..."
-python3 $BASE_DIR/step3_document_embedding.py && echo "✅ Step 3 Completed!"
+python3 $BASE_DIR/step3_document_embedding.py $STEP_ARGS && echo "✅ Step 3 Completed!"
 
 echo "🔹 Running Step 4: Vector Store Creation..."
-python3 $BASE_DIR/step4_vector_store.py && echo "✅ Step 4 Completed!"
+python3 $BASE_DIR/step4_vector_store.py $STEP_ARGS && echo "✅ Step 4 Completed!"
 
 echo "🔹 Running Step 5: Retrieval Testing..."
 python3 $BASE_DIR/step5_retrieval.py && echo "✅ Step 5 Completed!"
@@ -0,0 +1,136 @@
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# === Configuration ===
+SHARD_MODE = "none"  # "none" (single collection), "year" (one per release year) or "family" (one per spec family)
+SHARD_SEPARATOR = "__"  # Shard collections are named <base>__<shard>, e.g. oran_docs__2024 or oran_docs__wg3
+UNSHARDED = "all"  # Shard name reported for the single collection when SHARD_MODE is "none"
+UPLOAD_SHARD = "uploads"  # Year shard for browser uploads, which carry no release year
+SPEC_FAMILY_PATTERN = re.compile(r"(?i)(?:^|[^a-z0-9])(WG\d{1,2}|SFG|TIFG|OSFG|SDFG|NGRG|TSTG)(?=[^a-z0-9]|$)")
+MAX_FAN_OUT_THREADS = 8
+CONTENT_FILTER = {"chunk_type": "content"}  # IPR/copyright/TOC chunks are tagged at ingestion
+
+_executor = None
+
+# Collection name -> True when it was indexed before chunks carried chunk_type metadata
+_untagged = {}
+
+def spec_family(title):
+    """Spec family of an O-RAN document title, e.g. "O-RAN.WG3.E2AP-v02.00" -> "wg3"."""
+    match = SPEC_FAMILY_PATTERN.search(title or "")
+    return match.group(1).lower() if match else "misc"
+
+def shard_key(title, year=None, mode=SHARD_MODE):
+    """Shard a chunk belongs to under `mode`, or None when sharding is off."""
+    if mode == "year":
+        return str(year) if year else UPLOAD_SHARD
+    if mode == "family":
+        return spec_family(title)
+    return None
+
+def shard_collection_name(base_name, key):
+    """Collection name for shard `key` (the base collection itself when unsharded)."""
+    return base_name if key is None else f"{base_name}{SHARD_SEPARATOR}{key}"
+
+def list_shards(chroma_client, base_name):
+    """Names of the shards that exist for `base_name`."""
+    prefix = f"{base_name}{SHARD_SEPARATOR}"
+    names = [getattr(c, "name", c) for c in chroma_client.list_collections()]  # Objects or names, depending on Chroma version
+    return sorted(name[len(prefix):] for name in names if name.startswith(prefix))
+
+def open_shards(chroma_client, base_name, shards=None, mode=SHARD_MODE):
+    """Map shard name -> collection, optionally restricted to the `shards` subset."""
+    if mode == "none":
+        return {UNSHARDED: chroma_client.get_collection(base_name)}
+
+    available = list_shards(chroma_client, base_name)
+    if shards:
+        wanted = {str(shard).lower() for shard in shards}
+        missing = wanted.difference(available)
+        if missing:
+            print(f"⚠️ Unknown shard(s) ignored: {', '.join(sorted(missing))}")
+        available = [shard for shard in available if shard in wanted]
+    return {shard: chroma_client.get_collection(shard_collection_name(base_name, shard)) for shard in available}
+
+def prune_stale_chunks(collections, current_ids):
+    """Delete rows of each title in `current_ids` (title -> IDs just written) that are not among those IDs.
+
+    Chunk IDs are <title>_chunk_<n>, so an upsert of a document that now chunks shorter would leave
+    its old tail behind. Returns the number of rows deleted.
+    """
+    removed = 0
+    for collection in collections.values():
+        for title, ids in current_ids.items():
+            stale_ids = [chunk_id for chunk_id in collection.get(where={"title": title}, include=[])["ids"] if chunk_id not in ids]
+            if stale_ids:
+                collection.delete(ids=stale_ids)
+                removed += len(stale_ids)
+    return removed
+
+def content_filter(collection, where=None):
+    """`where` restricted to content chunks, or `where` alone for a collection indexed before tagging.
+
+    Such an index has no chunk_type metadata, so CONTENT_FILTER would match nothing: it is searched
+    unfiltered (boilerplate included) until a full step 4 run rebuilds it from re-tagged chunks.
+    """
+    if collection.name not in _untagged:
+        sample = collection.get(limit=1, include=["metadatas"])["metadatas"]
+        _untagged[collection.name] = bool(sample) and "chunk_type" not in (sample[0] or {})
+        if _untagged[collection.name]:
+            print(f"⚠️ {collection.name} has no chunk_type tags, searching it unfiltered. "
+                  f"Re-run steps 1–4 to exclude boilerplate.")
+    if _untagged[collection.name]:
+        return where
+    return {"$and": [where, CONTENT_FILTER]} if where else CONTENT_FILTER
+
+def _query_shard(shard, collection, query_embedding, n_results, where, include_embeddings=False):
+    start = time.perf_counter()
+    if callable(where):
+        where = where(collection)
+    results = collection.query(
+        query_embeddings=[query_embedding],
+        n_results=n_results,
+        where=where,
+        include=["documents", "metadatas", "distances"] + (["embeddings"] if include_embeddings else [])
+    )
+    hits = [
+        {
+            "shard": shard,
+            "document": results["documents"][0][i],
+            "metadata": results["metadatas"][0][i],
+            "distance": results["distances"][0][i],
+        }
+        for i in range(len(results["documents"][0]))
+    ]
+    if include_embeddings:
+        for hit, embedding in zip(hits, results["embeddings"][0]):
+            hit["embedding"] = embedding
+    return shard, hits, time.perf_counter() - start
+
+def fan_out_query(collections, query_embedding, n_results, where=None, include_embeddings=False):
+    """Query every shard in parallel and merge the global top `n_results` by distance.
+
+    `where` is a filter, or a function of the collection returning one (e.g. content_filter).
+    Returns (hits, latencies), where latencies maps shard name -> seconds. With `include_embeddings`,
+    each hit also carries its stored embedding (no extra round trip).
+    """
+    global _executor
+    if len(collections) == 1:
+        outcomes = [_query_shard(shard, collection, query_embedding, n_results, where, include_embeddings)
+                    for shard, collection in collections.items()]
+    else:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_FAN_OUT_THREADS, thread_name_prefix="shard")
+        futures = [_executor.submit(_query_shard, shard, collection, query_embedding, n_results, where, include_embeddings)
+                   for shard, collection in collections.items()]
+        outcomes = [future.result() for future in futures]
+
+    merged = [hit for _, hits, _ in outcomes for hit in hits]
+    merged.sort(key=lambda hit: hit["distance"])
+    latencies = {shard: elapsed for shard, _, elapsed in outcomes}
+    return merged[:n_results], latencies
+
+def format_latencies(latencies):
+    """One-line per-shard latency report."""
+    return ", ".join(f"{shard}={elapsed * 1000:.1f}ms" for shard, elapsed in sorted(latencies.items()))
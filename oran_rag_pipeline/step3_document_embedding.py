@@ -1,66 +1,115 @@
 import os
-import json
-from sentence_transformers import SentenceTransformer
+import time
+import argparse
+from embedding_backend import EMBEDDING_BACKEND, load_embedder
 from tqdm import tqdm
+from embedding_cache import EmbeddingCache
+from embedding_pool import EmbeddingPool
+from chunk_io import read_artifact, write_artifact, artifact_path, artifact_document_name, find_artifacts, find_years, iter_batches
+from profiling import StepProfiler, add_profile_argument
 
 # === Configuration ===
 CHUNKS_INPUT_BASE_DIR = "/home/sswarna/Documents/oran_docs/output_all/Step2_chunks"
 EMBEDDINGS_OUTPUT_BASE_DIR = "/home/sswarna/Documents/oran_docs/output_all/Step3_Embeddings"
 MODEL_PATH = "/home/sswarna/models/all-MiniLM-L12-v2"
+EMBED_BATCH_SIZE = 256  # Chunks read, embedded and written per batch (per worker when pooled)
+EMBED_WORKERS = 1  # >1: embed in that many worker processes (embedding_pool.py); 1 keeps the in-process model
+THREADS_PER_EMBED_WORKER = None  # Pinned threads per worker; None splits the cores evenly
 
 os.makedirs(EMBEDDINGS_OUTPUT_BASE_DIR, exist_ok=True)
 
-# Load locally stored embedding model
-model = SentenceTransformer(MODEL_PATH)
+# Locally stored embedding model (PyTorch or ONNX Runtime, see embedding_backend.py), loaded on first use:
+# pool workers re-import this module and must not each load a copy they never use
+model = None
 
-def process_file(input_filepath, output_filepath):
-    """Process a chunk file, generate embeddings, and save results."""
-    with open(input_filepath, "r", encoding="utf-8") as f:
-        chunks_data = json.load(f)
+def get_model():
+    global model
+    if model is None:
+        model = load_embedder(MODEL_PATH)
+    return model
 
-    if "chunks" not in chunks_data or not isinstance(chunks_data["chunks"], list):
-        print(f"❌ ERROR: Expected a list in {input_filepath}, but got {type(chunks_data)}")
-        return
+# Model and backend, e.g. "all-MiniLM-L12-v2:onnx-int8": stored on every row, so vectors from
+# different backends can be told apart in the index
+EMBEDDING_MODEL_NAME = f"{os.path.basename(MODEL_PATH)}:{EMBEDDING_BACKEND}"
 
-    # Extract title (ensuring backward compatibility)
-    title = chunks_data.get("title", os.path.basename(input_filepath).replace("_chunks.json", ""))
+# Embeddings of unchanged chunk texts are reused across runs and uploads (int8 vectors are cached separately)
+embedding_cache = EmbeddingCache(EMBEDDING_MODEL_NAME)
+
+def process_file(input_filepath, output_filepath, embedder=None):
+    """Stream a chunk artifact through the embedder into an embeddings artifact; returns the chunk count.
 
-    embeddings_data = []
-    for chunk in tqdm(chunks_data["chunks"], desc=f"Processing {os.path.basename(input_filepath)}"):
-        if "chunk_content" not in chunk:
-            continue
+    `embedder` is the in-process model by default, or an EmbeddingPool.
+    """
+    if not os.path.exists(input_filepath):
+        print(f"⚠️ ERROR: File not found: {input_filepath}")
+        return 0
 
-        chunk_text = chunk["chunk_content"]
-        embedding_vector = model.encode(chunk_text).tolist()
+    # Extract title (ensuring backward compatibility)
+    header, chunk_records = read_artifact(input_filepath)
+    source_file = artifact_document_name(os.path.basename(input_filepath), "chunks")
+    title = header.get("title") or source_file
 
-        embeddings_data.append({
-            "title": title,  # <-- ✅ Preserve title in embeddings output
-            "chunk_index": chunk["chunk_index"],
-            "chunk_content": chunk_text,
-            "embedding": embedding_vector,
-            "token_length": len(chunk_text.split()),
-            "source_file": os.path.basename(input_filepath).replace("_chunks.json", ""),
-            "embedding_model": "all-MiniLM-L12-v2"
-        })
+    encoder = embedder or get_model()
+    batch_size = EMBED_BATCH_SIZE * getattr(encoder, "workers", 1)  # Enough for every pool worker
 
-    # Save the embeddings
-    with open(output_filepath, "w", encoding="utf-8") as f:
-        json.dump(embeddings_data, f, indent=4)
+    def embedded_records():
+        chunks = (chunk for chunk in chunk_records if "chunk_content" in chunk)
+        for batch in iter_batches(chunks, batch_size):
+            vectors = embedding_cache.embed(encoder, [chunk["chunk_content"] for chunk in batch])
+            for chunk, embedding_vector in zip(batch, vectors):
+                chunk_text = chunk["chunk_content"]
+                yield {
+                    "title": title,  # <-- Preserve title in embeddings output
+                    "chunk_index": chunk["chunk_index"],
+                    "chunk_content": chunk_text,
+                    "embedding": embedding_vector,
+                    "token_length": len(chunk_text.split()),
+                    "source_file": source_file,
+                    "embedding_model": EMBEDDING_MODEL_NAME,
+                    "chunk_type": chunk.get("chunk_type", "content"),
+                    "section_path": chunk.get("section_path"),  # Set by structure-aware chunking only
+                    "page_start": chunk.get("page_start"),
+                    "page_end": chunk.get("page_end")
+                }
 
-    print(f"✅ Processed: {input_filepath} → {output_filepath}")
+    # Save the embeddings as they are produced
+    start_time = time.perf_counter()
+    count = write_artifact(output_filepath, {"title": title}, tqdm(embedded_records(), desc=f"Processing {os.path.basename(input_filepath)}"))
+    elapsed = time.perf_counter() - start_time
+    print(f"✅ Processed: {input_filepath} → {output_filepath} | {count} chunks embedded in {elapsed:.1f}s")
+    return count
 
 # === Process all chunk files ===
-for year in ["2022", "2023", "2024"]:
-    year_input_dir = os.path.join(CHUNKS_INPUT_BASE_DIR, f"Output_{year}")
-    year_output_dir = os.path.join(EMBEDDINGS_OUTPUT_BASE_DIR, f"Output_{year}")
-    os.makedirs(year_output_dir, exist_ok=True)
+def process_all_chunks(profiler=None, workers=EMBED_WORKERS):
+    profiler = profiler or StepProfiler("step3_embedding")
+    if workers > 1:
+        with EmbeddingPool(MODEL_PATH, workers, EMBEDDING_BACKEND, THREADS_PER_EMBED_WORKER) as pool:
+            embed_all_years(profiler, pool)
+    else:
+        embed_all_years(profiler)
+
+    print(embedding_cache.report())
+    print("🎯 Step 3: Embedding Generation Completed Successfully!")
+
+def embed_all_years(profiler, embedder=None):
+    for year in find_years(CHUNKS_INPUT_BASE_DIR, "Output_"):
+        year_input_dir = os.path.join(CHUNKS_INPUT_BASE_DIR, f"Output_{year}")
+        year_output_dir = os.path.join(EMBEDDINGS_OUTPUT_BASE_DIR, f"Output_{year}")
+        os.makedirs(year_output_dir, exist_ok=True)
 
-    print(f"\n🔹 Processing Year: {year}...\n")
+        print(f"\n🔹 Processing Year: {year}...\n")
 
-    for filename in tqdm(os.listdir(year_input_dir), desc=f"Year {year}"):
-        if filename.endswith("_chunks.json"):
-            input_filepath = os.path.join(year_input_dir, filename)
-            output_filepath = os.path.join(year_output_dir, filename.replace("_chunks.json", "_embeddings.json"))
-            process_file(input_filepath, output_filepath)
+        # JSONL artifacts, plus legacy _chunks.json and _chunks_partN.json files
+        for input_filepath in tqdm(find_artifacts(year_input_dir, "chunks"), desc=f"Year {year}"):
+            document_name = artifact_document_name(os.path.basename(input_filepath), "chunks")
+            output_filepath = artifact_path(os.path.join(year_output_dir, f"{document_name}_embeddings"))
+            with profiler.file(os.path.basename(input_filepath)) as stats:
+                stats["chunks"] = process_file(input_filepath, output_filepath, embedder)
 
-print("🎯 Step 3: Embedding Generation Completed Successfully!")
+if __name__ == "__main__":
+    parser = add_profile_argument(argparse.ArgumentParser(description="Step 3: embed chunk artifacts."))
+    parser.add_argument("--workers", type=int, default=EMBED_WORKERS,
+                        help="Embedding worker processes (see embedding_pool.py for a scaling report)")
+    args = parser.parse_args()
+    with StepProfiler("step3_embedding", enabled=args.profile) as profiler:
+        process_all_chunks(profiler, args.workers)
@@ -1,67 +1,195 @@
 import os
-import json
+import time
+import argparse
 import chromadb
 from tqdm import tqdm
+from sharding import SHARD_MODE, SHARD_SEPARATOR, shard_key, shard_collection_name, open_shards, prune_stale_chunks
+from chunk_io import find_artifacts, find_years, read_artifact, iter_batches
+from profiling import StepProfiler, add_profile_argument
+from index_versions import new_version_name, active_version, activate, validate_version, garbage_collect, ingest_lock, StoreWriteWatcher
+from index_profiles import get_or_create_profiled_collection
+from title_index import TitleIndex, add_titles, save_title_index, title_index_path
 
 # === Configuration ===
 EMBEDDINGS_INPUT_DIR = "/home/sswarna/Documents/oran_docs/output_all/Step3_Embeddings"
 CHROMA_DB_DIR = "/home/sswarna/Documents/oran_docs/oran_rag_pipeline/chroma_index"
 COLLECTION_NAME = "oran_docs"
+REBUILD_SHARDS = None  # e.g. ["2024"]: drop and rebuild only these shards of the active version, in place
+UPSERT_BATCH_SIZE = 256  # Rows written to Chroma per call
 
-# Remove old ChromaDB storage
-if os.path.exists(CHROMA_DB_DIR):
-    for file in os.listdir(CHROMA_DB_DIR):
-        file_path = os.path.join(CHROMA_DB_DIR, file)
-        if os.path.isfile(file_path):
-            os.remove(file_path)
-    print("🗑️ Cleared old ChromaDB storage.")
+# ChromaDB client, opened on first use
+chroma_client = None
 
-# Initialize ChromaDB
-chroma_client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
+# Writes by other processes (uploads, the ingest daemon); see sync_client()
+write_watcher = StoreWriteWatcher(CHROMA_DB_DIR)
 
-# Create or get collection
-collection = chroma_client.get_or_create_collection(name=COLLECTION_NAME)
+# Version being written: a fresh <COLLECTION_NAME>_v<timestamp> for full builds, the active one otherwise
+target_version = None
+
+# Collections are created on demand: just the version's collection, or one per shard when SHARD_MODE is set
+collections = {}
+
+# Every title written in this run, for the version's trigram title index (title_index.py)
+stored_titles = set()
+
+def get_chroma_client():
+    global chroma_client
+    if chroma_client is None:
+        chroma_client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
+    return chroma_client
+
+def sync_client():
+    """Call under ingest_lock before writing from a long-running process: reopen the client if another
+    process wrote since it loaded the store, so this process doesn't write through a stale index."""
+    global chroma_client
+    if write_watcher.poll() and chroma_client is not None:
+        chroma_client.clear_system_cache()
+        chroma_client = None
+        collections.clear()
+
+def get_target_version():
+    """Version written to; defaults to whichever version is currently serving."""
+    global target_version
+    if target_version is None:
+        target_version = active_version(CHROMA_DB_DIR, COLLECTION_NAME)
+    return target_version
+
+def drop_rebuild_shards():
+    """Drop the REBUILD_SHARDS collections of the active version before rebuilding them in place."""
+    for key in REBUILD_SHARDS:
+        try:
+            get_chroma_client().delete_collection(shard_collection_name(get_target_version(), key))
+            print(f"🗑️ Dropped shard: {key}")
+        except Exception:
+            print(f"⚠️ Shard {key} did not exist, creating it fresh.")
+
+def get_collection(key):
+    """Create or get the collection for shard `key` (None when unsharded), with INDEX_PROFILE's HNSW parameters."""
+    if key not in collections:
+        collections[key] = get_or_create_profiled_collection(get_chroma_client(), shard_collection_name(get_target_version(), key))
+    return collections[key]
+
+def store_file(input_filepath, year=None, prune=False):
+    """Upsert one embeddings artifact into its shard collection(s); returns the rows written.
+
+    With `prune`, rows of the same document beyond its new chunk count are deleted: needed when the
+    target already holds an older copy (catch-up pass, ingest daemon), not when building fresh.
+    """
+    _, embedding_records = read_artifact(input_filepath)
+    row_count = 0
+    written_ids = {}
+
+    for batch in iter_batches(embedding_records, UPSERT_BATCH_SIZE):
+        rows_by_shard = {}
+        for chunk in batch:
+            chunk_id = f"{chunk['title']}_chunk_{chunk['chunk_index']}"  # <-- Ensuring chunk ID is unique
+            embedding_vector = chunk.get("embedding")
+
+            # Ensure the correct document name is stored in metadata
+            metadata = {
+                "title": chunk.get("title", "Unknown"),  # <-- Preserve title
+                "source": chunk.get("source_file", "Unknown"),
+                "token_length": chunk.get("token_length", 0),
+                "embedding_model": chunk.get("embedding_model", "Unknown Model"),
+                "chunk_type": chunk.get("chunk_type", "content"),  # Boilerplate is tagged at ingestion
+            }
+            # Section path and pages from structure-aware chunking (Chroma rejects None values)
+            for field in ("section_path", "page_start", "page_end"):
+                if chunk.get(field) is not None:
+                    metadata[field] = chunk[field]
+
+            key = shard_key(metadata["title"], year)
+            if REBUILD_SHARDS and key not in REBUILD_SHARDS:
+                continue
+
+            if embedding_vector and isinstance(embedding_vector, list):
+                rows = rows_by_shard.setdefault(key, {"ids": [], "embeddings": [], "metadatas": [], "documents": []})
+                rows["ids"].append(chunk_id)
+                rows["embeddings"].append(embedding_vector)
+                rows["metadatas"].append(metadata)
+                rows["documents"].append(chunk.get("chunk_content", ""))
+                stored_titles.add(metadata["title"])
+                written_ids.setdefault(metadata["title"], set()).add(chunk_id)
+            else:
+                print(f"⚠️ Skipped chunk {chunk_id} due to missing or invalid embedding.")
+
+        for key, rows in rows_by_shard.items():
+            get_collection(key).upsert(**rows)
+            row_count += len(rows["ids"])
+
+    if prune:
+        stale = prune_stale_chunks(open_shards(get_chroma_client(), get_target_version()), written_ids)
+        if stale:
+            print(f"🧹 Removed {stale} chunks left from a previous, longer copy of {os.path.basename(input_filepath)}")
+    return row_count
 
 # Process all embedding files
-def store_embeddings(input_dir):
-    for year in ["2022", "2023", "2024"]:
-        year_dir = os.path.join(input_dir, f"Output_{year}")
+def store_embeddings(input_dir, profiler=None, since=None):
+    """Store every year's embedding artifacts, then browser uploads kept at the top of `input_dir`.
+
+    With `since`, only artifacts modified after that time are stored (used for catch-up before a swap).
+    """
+    profiler = profiler or StepProfiler("step4_vector_store")
+    sources = [(year, os.path.join(input_dir, f"Output_{year}")) for year in find_years(input_dir, "Output_")]
+    sources.append((None, input_dir))  # Uploads have no year
+    for year, year_dir in sources:
         if not os.path.exists(year_dir):
             print(f"⚠️ Skipping missing directory: {year_dir}")
             continue
 
-        print(f"📂 Processing Year: {year}")
-        for filename in tqdm(os.listdir(year_dir), desc=f"Year {year}"):
-            if not filename.endswith("_embeddings.json"):
+        print(f"📂 Processing {'Year: ' + year if year else 'Uploads'}")
+        # JSONL artifacts (read lazily), plus legacy _embeddings.json files
+        for input_filepath in tqdm(find_artifacts(year_dir, "embeddings"), desc=f"Year {year}" if year else "Uploads"):
+            if since is not None and os.path.getmtime(input_filepath) < since:
                 continue
+            with profiler.file(os.path.basename(input_filepath)) as stats:
+                stats["rows"] = store_file(input_filepath, year, prune=since is not None)
 
-            input_filepath = os.path.join(year_dir, filename)
-            with open(input_filepath, "r", encoding="utf-8") as f:
-                embedding_data = json.load(f)
-
-            for chunk in embedding_data:
-                chunk_id = f"{chunk['title']}_chunk_{chunk['chunk_index']}"  # <-- Ensuring chunk ID is unique
-                embedding_vector = chunk.get("embedding")
-
-                # Ensure the correct document name is stored in metadata
-                metadata = {
-                    "title": chunk.get("title", "Unknown"),  # <-- Preserve title
-                    "source": chunk.get("source_file", "Unknown"),
-                    "token_length": chunk.get("token_length", 0),
-                    "embedding_model": chunk.get("embedding_model", "Unknown Model"),
-                }
-
-                if embedding_vector and isinstance(embedding_vector, list):
-                    collection.add(
-                        ids=[chunk_id],
-                        embeddings=[embedding_vector],
-                        metadatas=[metadata],
-                        documents=[chunk.get("chunk_content", "")]
-                    )
-                else:
-                    print(f"⚠️ Skipped chunk {chunk_id} due to missing or invalid embedding.")
-
+    if SHARD_MODE != "none":
+        print(f"🧩 Shards ({SHARD_MODE}): " + ", ".join(f"{key}={collection.count()}" for key, collection in sorted(collections.items(), key=lambda item: str(item[0]))))
     print("✅ Step 4: Vector Store Updated Successfully!")
 
-# Run the storage function
-store_embeddings(EMBEDDINGS_INPUT_DIR)
+def build_new_version(profiler=None):
+    """Build a new index version next to the serving one, validate it, swap to it and collect old versions."""
+    global target_version
+    previous_version = active_version(CHROMA_DB_DIR, COLLECTION_NAME)
+    target_version = new_version_name(COLLECTION_NAME)
+    print(f"🏗️ Building {target_version} (still serving {previous_version})")
+
+    build_started = time.time()
+    store_embeddings(EMBEDDINGS_INPUT_DIR, profiler)
+
+    ok, message = validate_version(get_chroma_client(), target_version, previous_version)
+    if not ok:
+        print(f"❌ Validation failed, keeping {previous_version}: {message}")
+        return False
+    print(f"✅ Validated {message}")
+
+    # Uploads and daemon writes wait from here until the swap, so none can land in the old version
+    # after the catch-up pass has read it
+    with ingest_lock(CHROMA_DB_DIR):
+        # Uploads that landed in the old version during the build
+        store_embeddings(EMBEDDINGS_INPUT_DIR, since=build_started)
+
+        # Written before the swap, so serving processes find it as soon as they switch
+        save_title_index(TitleIndex(sorted(stored_titles)), title_index_path(CHROMA_DB_DIR, target_version))
+        print(f"🔤 Title index: {len(stored_titles)} titles")
+
+        activate(CHROMA_DB_DIR, target_version, previous_version)
+    dropped = garbage_collect(get_chroma_client(), CHROMA_DB_DIR, COLLECTION_NAME)
+    for version in {name.split(SHARD_SEPARATOR, 1)[0] for name in dropped}:
+        if os.path.exists(title_index_path(CHROMA_DB_DIR, version)):
+            os.remove(title_index_path(CHROMA_DB_DIR, version))
+    return True
+
+if __name__ == "__main__":
+    parser = add_profile_argument(argparse.ArgumentParser(description="Step 4: load embeddings into ChromaDB."))
+    args = parser.parse_args()
+    with StepProfiler("step4_vector_store", enabled=args.profile) as profiler:
+        if REBUILD_SHARDS:
+            drop_rebuild_shards()
+            store_embeddings(EMBEDDINGS_INPUT_DIR, profiler)
+            add_titles(CHROMA_DB_DIR, get_target_version(), stored_titles,
+                       open_shards(get_chroma_client(), get_target_version()))
+        elif not build_new_version(profiler):
+            raise SystemExit(1)
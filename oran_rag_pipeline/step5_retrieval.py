@@ -1,68 +1,89 @@
 import requests
 import json
-import chromadb
-import re
-from sentence_transformers import SentenceTransformer
-from Levenshtein import ratio  # Install with: pip install python-Levenshtein
+from embedding_backend import load_embedder
+from ollama_client import OllamaClient, timing_summary
+from sharding import SHARD_MODE, list_shards, open_shards, fan_out_query, format_latencies, content_filter
+from index_versions import serving_index
+from title_index import ServingTitleIndex, extract_title_mentions, stored_in
+from grounding import grounding_score
+from index_profiles import search_results
+from context_compression import COMPRESSION_RATIO, compress_chunks, format_compression
 
 # === Configuration ===
 OLLAMA_URL = "http://localhost:11434/api/generate"
 OLLAMA_MODEL = "llama2:7b"
 CHROMA_DB_DIR = "/home/sswarna/Documents/oran_docs/oran_rag_pipeline/chroma_index"
 COLLECTION_NAME = "oran_docs"
-TOP_K = 50  # Limit retrieved chunks
+TOP_K = 50  # Limit retrieved chunks; vector search asks for the index profile's n_results (index_profiles.py)
+OLLAMA_KEEP_ALIVE = "30m"  # Keep llama2 loaded between queries
 
 # Load embedding model
 EMBEDDING_MODEL_PATH = "/home/sswarna/models/all-MiniLM-L12-v2"
-embed_model = SentenceTransformer(EMBEDDING_MODEL_PATH)
+embed_model = load_embedder(EMBEDDING_MODEL_PATH)  # Same backend as ingestion (embedding_backend.py)
 
-# Initialize ChromaDB
-chroma_client = chromadb.PersistentClient(path=CHROMA_DB_DIR)
-collection = chroma_client.get_collection(COLLECTION_NAME)
+# Initialize ChromaDB (one collection per shard when SHARD_MODE is set), following the active index version
+serving = serving_index(CHROMA_DB_DIR, COLLECTION_NAME)
+shard_collections = {}
+_shard_generation = None
+
+def get_collections(shards=None):
+    """Shard name -> collection of the active version.
+
+    Reopened when step 4 activates a rebuild, and when the shard list changes: the ingest daemon
+    creates a shard for a new spec family in the active version without a swap.
+    """
+    global shard_collections, _shard_generation
+    serving.refresh()
+    if (_shard_generation != serving.generation
+            or (SHARD_MODE != "none" and list_shards(serving.client(), serving.version) != sorted(shard_collections))):
+        shard_collections = open_shards(serving.client(), serving.version)
+        _shard_generation = serving.generation
+    if shards:
+        return open_shards(serving.client(), serving.version, shards=shards)
+    return shard_collections
+
+# Trigram index over document titles, written by step 4 (fuzzy match: title_index.py)
+serving_titles = ServingTitleIndex(CHROMA_DB_DIR)
+
+# Shared, pooled Ollama client
+ollama_client = OllamaClient(OLLAMA_URL, OLLAMA_MODEL, keep_alive=OLLAMA_KEEP_ALIVE)
+
+# Fixed RAG instructions, sent as Ollama's `system` prompt: they form an identical prefix on every
+# call, so Ollama reuses its evaluation instead of re-reading them before each retrieved context
+RAG_SYSTEM_PROMPT = """### Instructions for LLM:
+- **Only answer based on the retrieved context.**
+- **Do not mix Non-RT RIC and Near-RT RIC roles.**
+- **Exclude security considerations unless explicitly mentioned in the retrieved context.**
+"""
 
 def embed_query(query):
     """Generate query embeddings to match stored embeddings."""
     return embed_model.encode(query).tolist()
 
-def extract_document_name(query):
-    """Extract document name if mentioned in query."""
-    match = re.search(r"(?:document|file)\s+([\w\.-]+)", query, re.IGNORECASE)
-    return match.group(1) if match else None
-
-def approximate_title_match(query_doc, stored_titles):
-    """Find the closest document title match using Levenshtein distance."""
-    best_match = None
-    best_score = 0
-    
-    for title in stored_titles:
-        match_score = ratio(query_doc.lower(), title.lower())
-        if match_score > best_score:
-            best_match = title
-            best_score = match_score
-    
-    return best_match if best_score > 0.85 else None  # Increased threshold to 85%
+def retrieve_relevant_chunks(query, shards=None):
+    """Retrieve relevant document chunks using metadata and vector search.
 
-def filter_irrelevant_content(text):
-    """Remove IPR and legal-related text from the retrieved content."""
-    filtered_text = re.sub(r'(?i)(IPR|copyright|patents|trademarks|terms of use).*', '', text)
-    return filtered_text.strip()
+    `shards` optionally restricts the search to a subset of shards (e.g. ["2024"]).
+    """
+    return serving.retrying(lambda: search_shards(query, shards))
 
-def retrieve_relevant_chunks(query):
-    """Retrieve relevant document chunks using metadata and vector search."""
-    doc_name = extract_document_name(query)
+def search_shards(query, shards=None):
     retrieved_chunks = []
+    collections = get_collections(shards)
+
+    # Spec identifiers anywhere in the query, fuzzily resolved to a title stored in the searched shards
+    doc_name = serving_titles.get(serving.version, get_collections).resolve(
+        query, accept=stored_in(collections) if shards else None
+    )
 
-    # Get stored document titles
-    stored_titles = set(metadata.get("title", "Unknown") for metadata in collection.get(include=["metadatas"])['metadatas'])
-    
     # If document name is found, use exact metadata search
     if doc_name:
         print(f"🔍 Detected document name in query: {doc_name}. Using Metadata + Vector Search.")
         
-        if doc_name in stored_titles:
+        for collection in collections.values():
             metadata_results = collection.get(
-                where={"title": doc_name},
-                include=["documents", "metadatas"]
+                where=content_filter(collection, {"title": doc_name}),
+                include=["documents", "metadatas", "embeddings"]  # Embeddings are reused for grounding
             )
             
             if metadata_results["documents"]:
@@ -70,28 +91,27 @@ def retrieve_relevant_chunks(query):
                     {
                         "source": metadata_results["metadatas"][i].get("title", "Unknown"),
                         "score": 1.0,
-                        "content": filter_irrelevant_content(metadata_results["documents"][i])
+                        "content": metadata_results["documents"][i],
+                        "embedding": metadata_results["embeddings"][i]
                     }
                     for i in range(len(metadata_results["documents"]))
                 ])
-        else:
-            print("Couldn't find a file")
+    elif extract_title_mentions(query):
+        print("Couldn't find a file")
     
-    # Perform Vector Search
+    # Perform Vector Search, fanned out to every shard and merged by distance
     query_embedding = embed_query(query)
-    results = collection.query(
-        query_embeddings=[query_embedding],
-        n_results=TOP_K,
-        include=["documents", "metadatas", "distances"]
-    )
+    hits, latencies = fan_out_query(collections, query_embedding, search_results(collections), where=content_filter, include_embeddings=True)
+    print(f"⏱️ Shard latency: {format_latencies(latencies)}")
     
     retrieved_chunks.extend([
         {
-            "source": results["metadatas"][0][i].get("title", "Unknown"),
-            "score": results["distances"][0][i],
-            "content": filter_irrelevant_content(results["documents"][0][i])
+            "source": hit["metadata"].get("title", "Unknown"),
+            "score": hit["distance"],
+            "content": hit["document"],
+            "embedding": hit["embedding"]
         }
-        for i in range(len(results["documents"][0]))
+        for hit in hits
     ])
     
     return retrieved_chunks[:TOP_K+2]
@@ -103,11 +123,6 @@ def generate_dynamic_prompt_using_llm(query, retrieved_chunks):
     context = "\n".join([f"Source: {chunk['source']}\n{chunk['content']}" for chunk in retrieved_chunks])
 
     llm_prompt = f"""
-    ### Instructions for LLM:
-    - **Only answer based on the retrieved context.** 
-    - **Do not mix Non-RT RIC and Near-RT RIC roles.**
-    - **Exclude security considerations unless explicitly mentioned in the retrieved context.**
-
     ### Retrieved Context:
     {context}
 
@@ -120,31 +135,60 @@ def generate_dynamic_prompt_using_llm(query, retrieved_chunks):
 
     
     try:
-        response = requests.post(OLLAMA_URL, json={"model": OLLAMA_MODEL, "prompt": llm_prompt, "stream": False})
-        if response.status_code == 200:
-            return response.json().get("response", "⚠️ No response from Ollama.")
-        else:
-            return f"❌ Error: {response.status_code}"
+        reply = ollama_client.generate(llm_prompt, system=RAG_SYSTEM_PROMPT)
+        print(f"⏱️ LLM: {timing_summary(reply)}")
+        return reply.get("response", "⚠️ No response from Ollama.")
+    except requests.HTTPError as e:
+        return f"❌ Error: {e.response.status_code}"
     except Exception as e:
         return f"❌ Ollama Request Failed: {e}"
 
+def warm_up_llm():
+    """Load the model before the first query so it doesn't pay Ollama's model-load time."""
+    try:
+        print(f"🔥 {OLLAMA_MODEL} loaded in {ollama_client.warm_up():.1f}s (kept alive for {OLLAMA_KEEP_ALIVE})")
+    except Exception as e:
+        print(f"⚠️ Ollama warm-up failed, the first query will load the model: {e}")
+
+def score_answer(answer, context_chunks):
+    """Grounding of a RAG answer in the context it was given (chunk embeddings; only the answer is embedded)."""
+    if answer.startswith(("❌", "⚠️")):
+        return None  # Error text, not an answer
+    return grounding_score(embed_model, answer, [chunk["embedding"] for chunk in context_chunks])
+
 def main():
+    warm_up_llm()
     print("🎯 Ollama RAG System Ready! Enter your queries below.")
     
     while True:
         query = input("🔍 Enter your query (or 'exit' to stop): ").strip()
         if query.lower() == "exit": 
             break
+
+        # "@2023,2024 <query>" restricts the search to those shards
+        shards = None
+        if SHARD_MODE != "none" and query.startswith("@"):
+            shard_spec, _, query = query[1:].partition(" ")
+            shards = [shard for shard in shard_spec.split(",") if shard]
         
-        retrieved_chunks = retrieve_relevant_chunks(query)
+        retrieved_chunks = retrieve_relevant_chunks(query, shards=shards)
         
         if not retrieved_chunks:
             print("⚠️ No relevant data retrieved.")
             continue
         
-        structured_prompt = generate_dynamic_prompt_using_llm(query, retrieved_chunks)
+        # Only the sentences most relevant to the query go into the prompt
+        context_chunks, compression = compress_chunks(embed_model, query, retrieved_chunks, COMPRESSION_RATIO)
+        print(f"🗜️ Context compression: {format_compression(compression)}")
+
+        structured_prompt = generate_dynamic_prompt_using_llm(query, context_chunks)
         print("\n📝 **Final Answer from LLM:**")
         print(structured_prompt)
 
+        grounding = score_answer(structured_prompt, context_chunks)
+        if grounding:
+            print(f"🎯 Confidence {grounding['confidence']:.2f}, "
+                  f"{grounding['faithfulness']:.0%} of {grounding['sentences']} sentences supported by the context")
+
 if __name__ == "__main__":
     main()